@@ -0,0 +1,172 @@
+import argparse
+import gzip
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+# Vectorized reports over a snapshot written by export.py (never touches the database)
+# Usage:
+#   python analytics.py exports/20240101-120000
+# The columns of products.npz are memory-mapped straight from the archive: the offset of
+# every member is taken from its zip header and the .npy header, so only the pages a
+# report touches are read and nothing is copied.
+
+PERCENTILES = [5, 25, 50, 75, 95]
+HISTOGRAM_BINS = 20
+
+# Local file header: signature, version, flags, compression, time, date, crc, sizes, name and extra lengths
+_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+
+def load_columns(npz_path):
+    """
+    Memory-maps all arrays of an uncompressed .npz file.
+
+    Returns:
+        A dict column name -> read-only numpy.memmap.
+    """
+    columns = {}
+    with zipfile.ZipFile(npz_path) as archive, open(npz_path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} in {npz_path} is compressed and can't be mapped")
+            f.seek(info.header_offset)
+            header = _LOCAL_HEADER.unpack(f.read(_LOCAL_HEADER.size))
+            name_length, extra_length = header[-2], header[-1]
+            f.seek(info.header_offset + _LOCAL_HEADER.size + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            columns[os.path.splitext(info.filename)[0]] = np.memmap(
+                npz_path, dtype=dtype, mode='r', offset=f.tell(), shape=shape, order='F' if fortran_order else 'C')
+    return columns
+
+
+def load_names(path, id_field, name_field):
+    """
+    id -> name from a .jsonl.gz export (brands, category); empty if the file is missing.
+    """
+    if not os.path.exists(path):
+        return {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return {doc[id_field]: doc.get(name_field) for doc in map(json.loads, f)}
+
+
+def price_per_inch(columns):
+    """
+    Distribution of price / diagonal over products with a known price and size.
+
+    Returns:
+        A dict with "count", "mean", "percentiles" ({p: value}) and "histogram" (counts, bin edges).
+    """
+    price, diagonal = columns['price'], columns['diagonal']
+    valid = np.isfinite(price) & (diagonal > 0)
+    values = price[valid] / diagonal[valid]
+    if not values.size:
+        return {"count": 0, "mean": None, "percentiles": {}, "histogram": ([], [])}
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean()),
+        "percentiles": dict(zip(PERCENTILES, np.percentile(values, PERCENTILES).tolist())),
+        "histogram": (counts.tolist(), edges.tolist()),
+    }
+
+
+def group_aggregates(columns, key):
+    """
+    Count, units, inventory value and min/avg/max price per brand_id or category_id.
+
+    Returns:
+        A list of dicts ordered by inventory value, largest first.
+    """
+    keys = columns[key]
+    known = keys >= 0
+    keys = keys[known]
+    price = columns['price'][known]
+    quantity = columns['quantity'][known]
+    if not keys.size:
+        return []
+
+    priced = np.isfinite(price)
+    prices = np.where(priced, price, 0.0)
+    size = int(keys.max()) + 1
+    count = np.bincount(keys, minlength=size)
+    units = np.bincount(keys, weights=quantity, minlength=size)
+    value = np.bincount(keys, weights=prices * quantity, minlength=size)
+    price_count = np.bincount(keys, weights=priced, minlength=size)
+    price_sum = np.bincount(keys, weights=prices, minlength=size)
+
+    # Min/max per group: sort by key, then reduce each run of equal keys
+    order = np.argsort(keys[priced], kind='stable')
+    sorted_keys, sorted_prices = keys[priced][order], price[priced][order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if sorted_keys.size else np.array([], int)
+    min_price = np.full(size, np.nan)
+    max_price = np.full(size, np.nan)
+    if starts.size:
+        group_keys = sorted_keys[starts]
+        min_price[group_keys] = np.minimum.reduceat(sorted_prices, starts)
+        max_price[group_keys] = np.maximum.reduceat(sorted_prices, starts)
+
+    present = np.flatnonzero(count)
+    rows = [{
+        key: int(group),
+        "count": int(count[group]),
+        "units": int(units[group]),
+        "value": float(value[group]),
+        "min_price": float(min_price[group]),
+        "avg_price": float(price_sum[group] / price_count[group]) if price_count[group] else float('nan'),
+        "max_price": float(max_price[group]),
+    } for group in present]
+    rows.sort(key=lambda row: -row["value"])
+    return rows
+
+
+def inventory_value(columns):
+    """
+    Total units and stock value (sum of price * quantity) of the snapshot.
+    """
+    price, quantity = columns['price'], columns['quantity']
+    priced = np.isfinite(price)
+    return {"units": int(quantity.sum()), "value": float(np.dot(price[priced], quantity[priced]))}
+
+
+def report(directory):
+    columns = load_columns(os.path.join(directory, 'products.npz'))
+    brand_names = load_names(os.path.join(directory, 'brands.jsonl.gz'), 'brand_id', 'brand_name')
+    category_names = load_names(os.path.join(directory, 'category.jsonl.gz'), 'category_id', 'category_name')
+
+    total = inventory_value(columns)
+    print(f"{len(columns['product_id'])} products, {total['units']} units, inventory value ${total['value']:,.2f}")
+
+    distribution = price_per_inch(columns)
+    print(f"\nPrice per inch ({distribution['count']} products):")
+    if distribution['count']:
+        print(f"  mean ${distribution['mean']:.2f}, " +
+              ", ".join(f"p{p} ${value:.2f}" for p, value in distribution['percentiles'].items()))
+        counts, edges = distribution['histogram']
+        peak = max(counts)
+        for count, low, high in zip(counts, edges, edges[1:]):
+            print(f"  ${low:8.2f} - ${high:8.2f} {'#' * round(40 * count / peak):<40} {count}")
+
+    for title, key, names in (("brand", "brand_id", brand_names), ("category", "category_id", category_names)):
+        print(f"\nBy {title}:")
+        for row in group_aggregates(columns, key):
+            print(f"  {names.get(row[key], row[key])}: {row['count']} products, {row['units']} units, "
+                  f"value ${row['value']:,.2f}, price ${row['min_price']:.2f} / ${row['avg_price']:.2f} / "
+                  f"${row['max_price']:.2f} (min / avg / max)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reports over a catalog snapshot written by export.py")
+    parser.add_argument('directory', help="Snapshot directory")
+    args = parser.parse_args()
+    report(args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import time
+
+from aiohttp import web
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import connection
+from ref_cache import VERSIONS_COLLECTION
+from repository import ProductRepository, facets_pipeline, resolved_pipeline
+
+# Read-only HTTP API for the catalog (asyncio, aiohttp + motor)
+# Usage:
+#   python api.py --port 8080
+#   GET /products?after=120&limit=50&brand_id=1,2&price_min=300&diagonal_max=65
+#   GET /products/{product_id}
+#   GET /products/facets?category_id=0&price_max=500
+#   GET /brands, /brands/{brand_id}, /categories, /categories/{category_id}
+# One client (and connection pool) is shared by all requests; URI, pool size, timeouts and
+# the read preference come from the MONGO_* settings (see connection.py).
+# Responses are gzip/deflate compressed when the client accepts it. Every response has an
+# ETag built from the catalog version counters (bumped by every write, see ref_cache.py),
+# so If-None-Match is answered with 304 without querying the catalog.
+# Product listings are streamed from the cursor, large pages are never held in memory.
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 10000
+CURSOR_BATCH_SIZE = 500
+# Bytes collected before a chunk of a streamed listing is written
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Version counters are read at most once per VERSION_TTL seconds
+VERSION_TTL = 0.5
+VERSIONED_COLLECTIONS = ('products', 'brands', 'category')
+
+# URL name -> (collection, id field)
+REFERENCES = {
+    'brands': ('brands', 'brand_id'),
+    'categories': ('category', 'category_id'),
+}
+
+DB_KEY = web.AppKey('db', object)
+VERSION_KEY = web.AppKey('version', object)
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+
+def _int(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be an integer")
+
+
+def _number(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be a number")
+
+
+def _ids(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return [int(part) for part in value.split(',')]
+    except ValueError:
+        raise web.HTTPBadRequest(text=f"{name} must be a comma separated list of integers")
+
+
+def parse_filter(params):
+    """
+    Builds a product filter from query parameters (brand_id, category_id, <field>_min, <field>_max).
+    """
+    ranges = {field: (_number(params, f"{field}_min"), _number(params, f"{field}_max"))
+              for field in ('price', 'diagonal', 'quantity')}
+    return ProductRepository.build_filter(brand_ids=_ids(params, 'brand_id'),
+                                          category_ids=_ids(params, 'category_id'), **ranges)
+
+
+def _limit(params):
+    limit = _int(params, 'limit', DEFAULT_LIMIT)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise web.HTTPBadRequest(text=f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+
+class CatalogVersion:
+    """
+    Current catalog version, shared by all requests and refreshed at most every VERSION_TTL seconds.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._value = None
+        self._read_at = 0.0
+
+    async def get(self):
+        now = time.monotonic()
+        if self._value is None or now - self._read_at > VERSION_TTL:
+            ids = [f"version:{name}" for name in VERSIONED_COLLECTIONS]
+            counters = {doc["_id"]: doc["v"] async for doc in
+                        self.db[VERSIONS_COLLECTION].find({"_id": {"$in": ids}}, {"v": 1})}
+            self._value = ".".join(str(counters.get(counter_id, 0)) for counter_id in ids)
+            self._read_at = now
+        return self._value
+
+
+async def _etag(request):
+    # Same catalog version and same URL give the same body
+    version = await request.app[VERSION_KEY].get()
+    digest = hashlib.sha1(f"{version} {request.path_qs}".encode()).hexdigest()[:20]
+    etag = f'"{digest}"'
+    if_none_match = request.headers.get('If-None-Match', '')
+    if if_none_match.strip() == '*' or etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(',')):
+        raise web.HTTPNotModified(headers={'ETag': etag})
+    return etag
+
+
+def _json_response(data, etag):
+    response = web.json_response(data, dumps=_dumps, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    response.enable_compression()
+    return response
+
+
+# Products
+async def list_products(request):
+    params = request.query
+    query = parse_filter(params)
+    after_id = _int(params, 'after')
+    limit = _limit(params)
+    etag = await _etag(request)
+
+    cursor = request.app[DB_KEY].products.aggregate(resolved_pipeline(query, after_id, limit),
+                                                    batchSize=CURSOR_BATCH_SIZE)
+
+    response = web.StreamResponse(headers={'Content-Type': 'application/json', 'ETag': etag,
+                                           'Cache-Control': 'no-cache'})
+    response.enable_compression()
+    await response.prepare(request)
+
+    # {"items": [...], "next_after": <last product_id, or null on the last page>}
+    chunk = [b'{"items":[']
+    size = 0
+    count = 0
+    last_id = None
+    async for doc in cursor:
+        data = (b',' if count else b'') + _dumps(doc).encode()
+        chunk.append(data)
+        size += len(data)
+        count += 1
+        last_id = doc["product_id"]
+        if size >= STREAM_CHUNK_SIZE:
+            await response.write(b''.join(chunk))
+            chunk, size = [], 0
+    chunk.append(f'],"next_after":{_dumps(last_id if count == limit else None)}}}'.encode())
+    await response.write(b''.join(chunk))
+    await response.write_eof()
+    return response
+
+
+async def get_product(request):
+    product_id = _int(request.match_info, 'product_id')
+    etag = await _etag(request)
+    docs = await request.app[DB_KEY].products.aggregate(resolved_pipeline({"product_id": product_id}, limit=1)).to_list(1)
+    if not docs:
+        raise web.HTTPNotFound(text=f"Product {product_id} not found")
+    return _json_response(docs[0], etag)
+
+
+async def product_facets(request):
+    params = request.query
+    query = parse_filter(params)
+    limit = _limit(params)
+    etag = await _etag(request)
+    result = (await request.app[DB_KEY].products.aggregate(facets_pipeline(query, limit)).to_list(1))[0]
+    result["total"] = result["total"][0]["count"] if result["total"] else 0
+    return _json_response(result, etag)
+
+
+# Brands and categories
+def _reference_handlers(collection_name, id_field):
+    async def list_references(request):
+        etag = await _etag(request)
+        docs = await request.app[DB_KEY][collection_name].find({}, {"_id": 0}).sort(id_field, 1).to_list(None)
+        return _json_response(docs, etag)
+
+    async def get_reference(request):
+        doc_id = _int(request.match_info, id_field)
+        etag = await _etag(request)
+        doc = await request.app[DB_KEY][collection_name].find_one({id_field: doc_id}, {"_id": 0})
+        if doc is None:
+            raise web.HTTPNotFound(text=f"{collection_name} {doc_id} not found")
+        return _json_response(doc, etag)
+
+    return list_references, get_reference
+
+
+async def _mongo_client(app):
+    # One client per process: its pool is shared by all concurrent requests
+    client = AsyncIOMotorClient(connection.SETTINGS['uri'], readPreference=connection.SETTINGS['read_preference'],
+                                **connection.client_options())
+    db = client[connection.SETTINGS['db']]
+    app[DB_KEY] = db
+    app[VERSION_KEY] = CatalogVersion(db)
+    yield
+    client.close()
+
+
+def create_app():
+    app = web.Application()
+    app.cleanup_ctx.append(_mongo_client)
+    app.router.add_get('/products', list_products)
+    app.router.add_get('/products/facets', product_facets)
+    app.router.add_get(r'/products/{product_id:\d+}', get_product)
+    for name, (collection_name, id_field) in REFERENCES.items():
+        list_references, get_reference = _reference_handlers(collection_name, id_field)
+        app.router.add_get(f'/{name}', list_references)
+        app.router.add_get(f'/{name}/{{{id_field}:\\d+}}', get_reference)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only HTTP API for the tv_store catalog")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--uri', default=connection.SETTINGS['uri'])
+    parser.add_argument('--db', default=connection.SETTINGS['db'])
+    parser.add_argument('--backlog', type=int, default=2048, help="Listen backlog for bursts of connections")
+    args = parser.parse_args()
+
+    connection.configure(uri=args.uri, db=args.db)
+    web.run_app(create_app(), host=args.host, port=args.port, backlog=args.backlog)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from pymongo import MongoClient
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+import cascade
+from extract import BACKENDS
+from id_allocator import sync_counter
+from indexes import ensure_indexes
+from inventory_stats import InventoryStats
+from repository import ProductRepository, ReferenceRepository
+from search import ProductSearch
+from storage import MemoryBackend
+from stock_buffer import StockBuffer
+
+# Benchmark harness for the main.py operations
+# Generates a synthetic catalog shaped like products.json / brands.json / category.json,
+# runs every operation non-interactively through the repositories and stores
+# throughput and p50/p95/p99 latencies as JSON.
+# Usage:
+#   python benchmark.py --products 100000 --brands 200 --skew 1.2
+#   python benchmark.py --products 100000 --compare bench_results/<earlier run>.json
+# The catalog is loaded into a separate database (tv_store_bench by default), which is dropped first.
+# --in-process runs against mongomock instead of a mongod (no explain, text search falls back to memory).
+# --backend memory runs the same operations on the in-process engine (see memory_engine.py).
+
+BRAND_WORDS = ['Apple', 'Samsung', 'Sony', 'LG', 'Philips', 'Panasonic', 'TCL', 'Hisense', 'Sharp', 'Vizio', 'Toshiba', 'Xiaomi']
+CATEGORY_WORDS = ['LED', 'OLED', 'QLED', 'Mini-LED', 'MicroLED', 'Plasma', 'LCD', 'NanoCell']
+MODEL_WORDS = ['Bravia', 'Neo', 'The Frame', 'Crystal', 'Evo', 'Ambilight', 'Quantum', 'Ultra', 'Smart', 'Pro']
+FEATURES = ['4K', '8K', 'HDR', '120Hz', 'Dolby Vision', 'HDMI 2.1', 'Smart TV', 'Local dimming']
+DIAGONALS = [32, 40, 43, 50, 55, 65, 75, 77, 83, 85, 98]
+
+PAGE_SIZE = 20
+
+
+# Catalog generator
+def _zipf_cum_weights(count, skew):
+    # Item i gets weight 1 / (i + 1) ** skew; skew 0 is uniform
+    return list(itertools.accumulate(1 / (i + 1) ** skew for i in range(count)))
+
+
+def generate_brands(count):
+    for brand_id in range(count):
+        base = BRAND_WORDS[brand_id % len(BRAND_WORDS)]
+        name = base if brand_id < len(BRAND_WORDS) else f"{base} {brand_id}"
+        yield {
+            "brand_id": brand_id,
+            "brand_name": name,
+            "brand_description": f"{name} consumer electronics",
+            "headquarters": "Unknown",
+            "founded_year": 1900 + brand_id % 120,
+            "website": f"https://www.{name.lower().replace(' ', '')}.com"
+        }
+
+
+def generate_categories(count):
+    for category_id in range(count):
+        base = CATEGORY_WORDS[category_id % len(CATEGORY_WORDS)]
+        name = base if category_id < len(CATEGORY_WORDS) else f"{base} {category_id}"
+        yield {
+            "category_id": category_id,
+            "category_name": name,
+            "category_description": f"{name} TVs",
+            "category_type": "Display Technology",
+            "target_audience": "General consumers"
+        }
+
+
+def generate_products(count, brands, categories, skew=1.0, seed=0, start_id=100):
+    """
+    Yields products with brand and category chosen with a Zipf-like skew (a few brands hold most products).
+    """
+    rng = random.Random(seed)
+    brand_weights = _zipf_cum_weights(len(brands), skew)
+    category_weights = _zipf_cum_weights(len(categories), skew)
+    for product_id in range(start_id, start_id + count):
+        brand = rng.choices(brands, cum_weights=brand_weights)[0]
+        category = rng.choices(categories, cum_weights=category_weights)[0]
+        diagonal = rng.choice(DIAGONALS)
+        feature = rng.choice(FEATURES)
+        yield {
+            "product_id": product_id,
+            "name": f"{brand['brand_name']} {rng.choice(MODEL_WORDS)} {diagonal} inch {feature} TV",
+            "price": round(diagonal * rng.uniform(8, 60), 2),
+            "quantity": rng.randint(0, 500),
+            "diagonal": diagonal,
+            "description": f"{category['category_name']} TV with {feature} and {rng.choice(FEATURES)}",
+            "brand_id": brand['brand_id'],
+            "category_id": category['category_id']
+        }
+
+
+def load_catalog(db, products, brands, categories, batch_size=10000):
+    db['brands'].insert_many(brands)
+    db['category'].insert_many(categories)
+    batch = []
+    for product in products:
+        batch.append(product)
+        if len(batch) == batch_size:
+            db['products'].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db['products'].insert_many(batch, ordered=False)
+    ensure_indexes(db)
+    sync_counter(db, 'products', db['products'], 'product_id', 100)
+    sync_counter(db, 'brands', db['brands'], 'brand_id')
+    sync_counter(db, 'category', db['category'], 'category_id')
+
+
+def generate_listing_pages(products, per_page=40):
+    # HTML listing pages in the layout import.py scrapes
+    for start in range(0, len(products), per_page):
+        items = ''.join(
+            f'<div class="gridview-item"><a class="product-title-link" href="/p/{product["product_id"]}">{product["name"]}</a>'
+            f'<span class="price">${product["price"]:,.2f}</span><div class="rating">{"*" * 4}</div></div>'
+            for product in products[start:start + per_page]
+        )
+        yield f'<html><head><script>{"var x=1;" * 500}</script></head><body><nav>{"<a href=#>link</a>" * 200}</nav>{items}</body></html>'.encode()
+
+
+# Measurement
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(name, operation, iterations):
+    """
+    Runs operation(i) `iterations` times.
+
+    Returns:
+        A dict with throughput (ops/sec) and p50/p95/p99 latency in milliseconds.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        op_started = time.perf_counter()
+        operation(i)
+        latencies.append((time.perf_counter() - op_started) * 1000)
+    total = time.perf_counter() - started
+    latencies.sort()
+    result = {
+        "operation": name,
+        "iterations": iterations,
+        "total_s": round(total, 4),
+        "ops_per_sec": round(iterations / total, 2) if total else None,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+    print(f"{name:>28}: {result['ops_per_sec']:>10} ops/s  p50 {result['p50_ms']:>8} ms  "
+          f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms")
+    return result
+
+
+def run_benchmarks(db, args):
+    """
+    Args:
+        db: An empty database, or None to run on the in-process engine (--backend memory).
+    """
+    rng = random.Random(args.seed)
+    brands = list(generate_brands(args.brands))
+    categories = list(generate_categories(args.categories))
+
+    print(f"Loading {args.products} products, {args.brands} brands, {args.categories} categories...")
+    started = time.perf_counter()
+    if db is None:
+        backend = MemoryBackend(seed_files=())
+        backend.brands.create_many(brands)
+        backend.categories.create_many(categories)
+        backend.products.create_many(generate_products(args.products, brands, categories, args.skew, args.seed))
+        products, brand_repository, category_repository = backend.products, backend.brands, backend.categories
+        stats = backend.inventory_stats
+        search_mode = 'memory'
+    else:
+        load_catalog(db, generate_products(args.products, brands, categories, args.skew, args.seed), brands, categories)
+    print(f"Loaded in {time.perf_counter() - started:.1f}s\n")
+
+    if db is not None:
+        # Pauses between cascade chunks are not part of what is measured
+        cascade.CHUNK_PAUSE = 0
+        if args.in_process:
+            # The stand-in has no sessions, so no transactions
+            cascade.TRANSACTION_LIMIT = 0
+        stats = InventoryStats(db)
+        stats.reconcile()
+        products = ProductRepository(db, stats=stats)
+        brand_repository = ReferenceRepository(db, 'brands', 'brand_id', 'brand_name', products=products)
+        category_repository = ReferenceRepository(db, 'category', 'category_id', 'category_name', products=products)
+        search_mode = 'memory' if args.in_process else 'auto'
+    search = ProductSearch(products, mode=search_mode)
+
+    max_id = 100 + args.products - 1
+    iterations = args.iterations
+    results = []
+
+    def random_id():
+        return rng.randint(100, max_id)
+
+    results.append(measure('get_free_id_products', lambda i: products.next_id(), iterations))
+    results.append(measure('create_product', lambda i: products.create(
+        next(generate_products(1, brands, categories, args.skew, args.seed + i, start_id=0)) | {"product_id": None}
+    ), iterations))
+    results.append(measure('get_brands (cached)', lambda i: brand_repository.all(), iterations))
+    results.append(measure('display_products (all, page)', lambda i: list(
+        products.find_resolved({}, random_id(), PAGE_SIZE)), iterations))
+    results.append(measure('display_products (brand, page)', lambda i: list(
+        products.find_resolved({"brand_id": rng.randrange(args.brands)}, None, PAGE_SIZE)), iterations))
+    results.append(measure('display_products_short (page)', lambda i: list(
+        products.find_page(None, {"_id": 0, "product_id": 1, "name": 1}, random_id(), PAGE_SIZE)), iterations))
+
+    def filter_once(i):
+        low = rng.choice(DIAGONALS)
+        query = products.build_filter(price=(None, rng.uniform(500, 3000)), diagonal=(low, low + 10),
+                                      brand_ids=rng.sample(range(args.brands), min(3, args.brands)))
+        products.filter_with_facets(query, PAGE_SIZE)
+    results.append(measure('filter_with_facets', filter_once, iterations))
+
+    results.append(measure('search_products', lambda i: search.search(
+        rng.choice(BRAND_WORDS + MODEL_WORDS), 0, PAGE_SIZE), iterations))
+    results.append(measure('update_product', lambda i: products.update_by_id(
+        random_id(), {"price": round(rng.uniform(100, 5000), 2), "quantity": rng.randint(0, 500)}), iterations))
+    results.append(measure('adjust_stock', lambda i: products.adjust_stock(random_id(), rng.choice((-1, 1))),
+                           iterations))
+
+    def buffered_stock(i):
+        # 1000 order lines on 100 products, coalesced into one flush
+        buffer = StockBuffer(products, flush_interval=3600)
+        for _ in range(1000):
+            buffer.adjust(rng.randint(100, 199), rng.choice((-1, 1)))
+        buffer.close()
+    results.append(measure('stock buffer (1000 adjustments)', buffered_stock, max(1, iterations // 20)))
+    results.append(measure('inventory stats (brands + categories)', lambda i: (
+        stats.by('brand_id'), stats.by('category_id')), iterations))
+    results.append(measure('update_many_by_id (1000)', lambda i: products.update_many_by_id(
+        {random_id(): {"quantity": rng.randint(0, 500)} for _ in range(1000)}), max(1, iterations // 20)))
+
+    removable = rng.sample(range(100, max_id + 1), min(iterations, args.products // 2))
+    results.append(measure('remove_product', lambda i: products.delete_by_id(removable[i]), len(removable)))
+
+    # Cascades on the smallest brands and categories (the largest ones are kept for the other runs)
+    cascades = min(3, args.brands - 1)
+    results.append(measure('remove_brand (cascade)', lambda i: brand_repository.delete_by_id(
+        args.brands - 1 - i), cascades))
+    cascades = min(2, args.categories - 1)
+    results.append(measure('remove_category (cascade)', lambda i: category_repository.delete_by_id(
+        args.categories - 1 - i), cascades))
+
+    # Scraper extraction over synthetic listing pages
+    sample = list(generate_products(min(args.products, 4000), brands, categories, args.skew, args.seed))
+    pages = list(generate_listing_pages(sample))
+    for name, extractor in BACKENDS.items():
+        results.append(measure(f'scrape extract ({name})', lambda i: extractor(pages[i % len(pages)]),
+                               min(iterations, len(pages) * 3)))
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """
+    Prints the change of throughput and p95 latency against an earlier result file.
+    """
+    before = {result['operation']: result for result in previous['results']}
+    print(f"\nCompared with {previous.get('revision')} ({previous.get('timestamp')}):")
+    for result in current['results']:
+        old = before.get(result['operation'])
+        if not old or not old['ops_per_sec'] or not result['ops_per_sec']:
+            continue
+        throughput = (result['ops_per_sec'] / old['ops_per_sec'] - 1) * 100
+        p95 = (result['p95_ms'] / old['p95_ms'] - 1) * 100 if old['p95_ms'] else 0
+        print(f"{result['operation']:>28}: throughput {throughput:+7.1f}%  p95 {p95:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tv_store operations on a synthetic catalog")
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--brands', type=int, default=50)
+    parser.add_argument('--categories', type=int, default=8)
+    parser.add_argument('--skew', type=float, default=1.0, help="Zipf exponent of the brand/category distribution (0 - uniform)")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--db', default='tv_store_bench')
+    parser.add_argument('--in-process', action='store_true', help="Use an in-process stand-in (mongomock) instead of a mongod")
+    parser.add_argument('--backend', choices=['mongodb', 'memory'], default='mongodb',
+                        help="Storage backend the operations run on (see storage.py)")
+    parser.add_argument('--output', help="Result file (default: bench_results/<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    if args.backend == 'memory':
+        results = run_benchmarks(None, args)
+    else:
+        if args.in_process:
+            if mongomock is None:
+                parser.error("--in-process needs the mongomock package")
+            client = mongomock.MongoClient()
+        else:
+            client = MongoClient(args.uri)
+        client.drop_database(args.db)
+        db = client[args.db]
+        try:
+            results = run_benchmarks(db, args)
+        finally:
+            client.drop_database(args.db)
+
+    timestamp = datetime.now(timezone.utc)
+    report = {
+        "timestamp": timestamp.isoformat(),
+        "revision": _git_revision(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'uri')},
+        "results": results,
+    }
+
+    output = args.output or os.path.join('bench_results', f"{timestamp:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
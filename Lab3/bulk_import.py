@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from pymongo import ASCENDING, ReplaceOne
+
+import connection
+from id_allocator import sync_counter
+from indexes import REQUIRED_INDEXES, ensure_indexes
+from inventory_stats import InventoryStats
+from ref_cache import bump_version
+
+# Built-in replacement for the mongoimport step from README.txt.
+# Usage:
+#   python bulk_import.py                              (imports the three shipped JSON files)
+#   python bulk_import.py products products.json --workers 8 --batch-size 5000
+#   python bulk_import.py products big.jsonl --checkpoint import.ckpt   (resumable)
+#   python bulk_import.py --write-concern 1                               (faster than majority on a replica set)
+# Connection settings default to the MONGO_* environment variables (see connection.py).
+
+# collection name -> (key field, first id for the ID counter)
+COLLECTION_KEYS = {
+    'products': ('product_id', 100),
+    'brands': ('brand_id', 0),
+    'category': ('category_id', 0),
+}
+
+DEFAULT_FILES = [
+    ('brands', 'brands.json'),
+    ('category', 'category.json'),
+    ('products', 'products.json'),
+]
+
+
+def iter_json_documents(path, chunk_size=1 << 20):
+    """
+    Streams documents from a JSON array file or a JSON Lines file without loading it whole.
+
+    Args:
+        path: Path to the file.
+        chunk_size: Number of characters read from the file at a time.
+
+    Yields:
+        One parsed document at a time.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        in_array = None
+
+        while True:
+            # Skip separators between documents
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+
+            if pos >= len(buffer) or (not eof and len(buffer) - pos < chunk_size // 2):
+                if not eof:
+                    chunk = f.read(chunk_size)
+                    eof = chunk == ''
+                    buffer = buffer[pos:] + chunk
+                    pos = 0
+                    continue
+                if pos >= len(buffer):
+                    return
+
+            if in_array is None:
+                in_array = buffer[pos] == '['
+                if in_array:
+                    pos += 1
+                continue
+
+            if in_array and buffer[pos] == ']':
+                return
+
+            try:
+                document, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # Document is cut at the end of the buffer, read more
+                chunk = f.read(chunk_size)
+                eof = chunk == ''
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+
+            yield document
+            pos = end
+
+
+def iter_batches(documents, batch_size):
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_checkpoint(checkpoint_path, path, collection_name):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('path') != os.path.abspath(path) or checkpoint.get('collection') != collection_name:
+        return 0
+    return checkpoint['done']
+
+
+def _write_checkpoint(checkpoint_path, path, collection_name, done):
+    tmp_path = checkpoint_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'path': os.path.abspath(path), 'collection': collection_name, 'done': done}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def import_file(db, collection_name, path, batch_size=1000, workers=4, checkpoint_path=None, write_concern=None):
+    """
+    Upserts all documents of a file into a collection with parallel unordered bulk writes.
+
+    Every document replaces the one with the same key (product_id, brand_id or category_id),
+    so running the import twice or resuming after a crash never creates duplicates.
+
+    Args:
+        db: Target database.
+        collection_name: One of "products", "brands", "category".
+        path: JSON array or JSON Lines file.
+        batch_size: Documents per bulk_write call.
+        workers: Number of batches written in parallel.
+        checkpoint_path: File that records progress; the import resumes from it if it exists.
+        write_concern: WriteConcern of the bulk writes, None for the client's default.
+
+    Returns:
+        Number of documents written in this run.
+    """
+    key_field, start_id = COLLECTION_KEYS[collection_name]
+    collection = db[collection_name]
+    if write_concern is not None:
+        collection = collection.with_options(write_concern=write_concern)
+
+    # The unique key index makes every upsert an index lookup. The other indexes are built
+    # after the load, so the upserts don't have to maintain them
+    key_index = [index for index in REQUIRED_INDEXES[collection_name] if index[0] == [(key_field, ASCENDING)]]
+    ensure_indexes(db, {collection_name: key_index})
+
+    skip = _read_checkpoint(checkpoint_path, path, collection_name)
+    if skip:
+        print(f"Resuming {collection_name} import after {skip} documents")
+
+    def write_batch(batch):
+        requests = [ReplaceOne({key_field: document[key_field]}, document, upsert=True) for document in batch]
+        collection.bulk_write(requests, ordered=False)
+        return len(batch)
+
+    lock = threading.Lock()
+    finished = {}  # batch number -> size, for batches finished out of order
+    progress = {'next': 0, 'done': skip}
+    written = 0
+    started = time.perf_counter()
+
+    def batch_finished(number, size):
+        # Advances the checkpoint only over batches that are all written
+        with lock:
+            finished[number] = size
+            while progress['next'] in finished:
+                progress['done'] += finished.pop(progress['next'])
+                progress['next'] += 1
+            if checkpoint_path:
+                _write_checkpoint(checkpoint_path, path, collection_name, progress['done'])
+
+    documents = iter_json_documents(path)
+    for _ in range(skip):
+        next(documents, None)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for number, batch in enumerate(iter_batches(documents, batch_size)):
+            # Keep a bounded number of batches in memory
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    size = future.result()
+                    written += size
+                    batch_finished(pending.pop(future), size)
+
+                elapsed = time.perf_counter() - started
+                print(f"\r{collection_name}: {written} documents, {written / elapsed:.0f} docs/sec", end='')
+
+            pending[executor.submit(write_batch, batch)] = number
+
+        for future in wait(pending).done:
+            size = future.result()
+            written += size
+            batch_finished(pending[future], size)
+
+    elapsed = time.perf_counter() - started
+    rate = written / elapsed if elapsed else 0
+    print(f"\r{collection_name}: {written} documents imported in {elapsed:.2f}s ({rate:.0f} docs/sec)")
+
+    created = ensure_indexes(db, {collection_name: REQUIRED_INDEXES[collection_name]})
+    if created:
+        print(f"Created indexes: {', '.join(created)}")
+
+    # New records created in the app must continue after the imported IDs
+    sync_counter(db, collection_name, collection, key_field, start_id)
+    # Cached copies and API ETags must not outlive the import
+    bump_version(db, collection_name)
+    if collection_name == 'products':
+        # Imported products bypass the repository: rebuild the inventory statistics
+        InventoryStats(db).reconcile()
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import JSON or JSON Lines files into tv_store")
+    parser.add_argument('collection', nargs='?', choices=list(COLLECTION_KEYS), help="Target collection")
+    parser.add_argument('path', nargs='?', help="JSON array or JSON Lines file")
+    parser.add_argument('--uri', default=connection.SETTINGS['uri'])
+    parser.add_argument('--db', default=connection.SETTINGS['db'])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--checkpoint', help="Checkpoint file for resumable imports")
+    parser.add_argument('--write-concern', default=connection.SETTINGS['bulk_write_concern'],
+                        help="w of the bulk writes, e.g. 1 or majority")
+    args = parser.parse_args()
+
+    if bool(args.collection) != bool(args.path):
+        parser.error("collection and path must be given together")
+
+    connection.configure(uri=args.uri, db=args.db, bulk_write_concern=args.write_concern)
+    db = connection.get_db()
+    if args.collection:
+        files = [(args.collection, args.path)]
+    else:
+        here = os.path.dirname(os.path.abspath(__file__))
+        files = [(name, os.path.join(here, file_name)) for name, file_name in DEFAULT_FILES]
+
+    for collection_name, path in files:
+        import_file(db, collection_name, path, args.batch_size, args.workers, args.checkpoint,
+                    connection.bulk_write_concern())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import time
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import ConfigurationError, OperationFailure
+
+from inventory_stats import STATS_PROJECTION
+
+# Cascade-delete engine for remove_brand / remove_category
+# Dependent products are removed in chunks ordered by product_id (served by the
+# (brand_id, product_id) / (category_id, product_id) indexes). A job document in
+# "cascade_jobs" works as a tombstone: it exists from the first chunk until the
+# parent is gone, so an interrupted cascade is finished by resume_cascades().
+# IDs removed by a cascade are never recycled (see id_allocator.RECYCLE_IDS).
+
+JOBS_COLLECTION = 'cascade_jobs'
+
+CHUNK_SIZE = 1000
+# Pause between chunks (seconds), to leave room for other traffic on the primary
+CHUNK_PAUSE = 0.05
+# Cascades up to this many products run in one transaction when the server supports it (0 - never)
+TRANSACTION_LIMIT = 500
+
+# parent collection -> field that references it in products
+PARENT_FIELDS = {
+    'brands': 'brand_id',
+    'category': 'category_id',
+}
+
+
+def _print_progress(job):
+    print(f"\rRemoving products of {job['_id']}: {job['deleted']} removed", end='', flush=True)
+
+
+def _delete_in_transaction(db, parent_collection, field, parent_id):
+    # All or nothing for small cascades; raises if the server has no transactions
+    def callback(session):
+        removed = list(db['products'].find({field: parent_id}, STATS_PROJECTION, session=session))
+        db['products'].delete_many({field: parent_id}, session=session)
+        db[parent_collection].delete_one({field: parent_id}, session=session)
+        return removed
+
+    with db.client.start_session() as session:
+        return session.with_transaction(callback)
+
+
+def cascade_delete(db, parent_collection, parent_id, chunk_size=None, pause=None, progress=_print_progress,
+                   on_deleted=None):
+    """
+    Removes a brand or category together with all of its products.
+
+    Args:
+        db: The tv_store database.
+        parent_collection: "brands" or "category".
+        parent_id: brand_id or category_id of the parent.
+        chunk_size: Products removed per delete_many call.
+        pause: Seconds to wait between chunks.
+        progress: Callable job -> None, called after every chunk.
+        on_deleted: Callable list of removed products -> None, called for every removed chunk.
+            The products carry product_id and the fields of STATS_PROJECTION.
+
+    Returns:
+        Number of removed products.
+    """
+    field = PARENT_FIELDS[parent_collection]
+    chunk_size = chunk_size or CHUNK_SIZE
+    pause = CHUNK_PAUSE if pause is None else pause
+    jobs = db[JOBS_COLLECTION]
+    products = db['products']
+    job_id = f"{parent_collection}:{parent_id}"
+
+    # Small cascades that are not resumed: try one transaction
+    if TRANSACTION_LIMIT and jobs.find_one({"_id": job_id}) is None and \
+            products.count_documents({field: parent_id}, limit=TRANSACTION_LIMIT + 1) <= TRANSACTION_LIMIT:
+        try:
+            removed = _delete_in_transaction(db, parent_collection, field, parent_id)
+        except (OperationFailure, ConfigurationError):
+            pass  # Standalone server, no transactions: fall back to chunks
+        else:
+            if on_deleted and removed:
+                on_deleted(removed)
+            return len(removed)
+
+    jobs.update_one(
+        {"_id": job_id},
+        {"$setOnInsert": {
+            "parent_collection": parent_collection,
+            "parent_id": parent_id,
+            "last_id": None,
+            "deleted": 0,
+            "started_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    job = jobs.find_one({"_id": job_id})
+    removed_before = job['deleted']
+
+    while True:
+        chunk = list(products.find({field: parent_id}, STATS_PROJECTION).sort("product_id", 1).limit(chunk_size))
+        if not chunk:
+            break
+
+        ids = [product['product_id'] for product in chunk]
+        result = products.delete_many({field: parent_id, "product_id": {"$in": ids}})
+        if on_deleted:
+            on_deleted(chunk)
+        job = jobs.find_one_and_update(
+            {"_id": job_id},
+            {"$set": {"last_id": ids[-1]}, "$inc": {"deleted": result.deleted_count}},
+            return_document=ReturnDocument.AFTER
+        )
+        if progress:
+            progress(job)
+        if pause:
+            time.sleep(pause)
+
+    db[parent_collection].delete_one({field: parent_id})
+    jobs.delete_one({"_id": job_id})
+    if progress is _print_progress:
+        print()
+    return job['deleted'] - removed_before
+
+
+def resume_cascades(db, progress=_print_progress, on_deleted=None):
+    """
+    Finishes cascades that were interrupted (e.g. by a crash).
+    on_deleted is passed to cascade_delete.
+
+    Returns:
+        A list of job ids that were resumed.
+    """
+    resumed = []
+    for job in list(db[JOBS_COLLECTION].find()):
+        print(f"Resuming removal of {job['_id']} after {job['deleted']} products")
+        cascade_delete(db, job['parent_collection'], job['parent_id'], progress=progress, on_deleted=on_deleted)
+        resumed.append(job['_id'])
+    return resumed
@@ -0,0 +1,147 @@
+import os
+import threading
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.write_concern import WriteConcern
+
+# Connection manager
+# The client is created on first use, not at import time. Settings come from the
+# environment (or configure()):
+#   MONGO_URI                          default mongodb://localhost:27017/
+#   MONGO_DB                           default tv_store
+#   MONGO_MAX_POOL_SIZE / MONGO_MIN_POOL_SIZE
+#   MONGO_CONNECT_TIMEOUT_MS / MONGO_SERVER_SELECTION_TIMEOUT_MS / MONGO_SOCKET_TIMEOUT_MS
+#   MONGO_READ_PREFERENCE              read preference of the display (browse) queries,
+#                                      default secondaryPreferred
+#   MONGO_BULK_WRITE_CONCERN           w of the batch write paths (e.g. 1, majority), default: client's
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+SETTINGS = {
+    'uri': os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'),
+    'db': os.environ.get('MONGO_DB', 'tv_store'),
+    'maxPoolSize': _env_int('MONGO_MAX_POOL_SIZE'),
+    'minPoolSize': _env_int('MONGO_MIN_POOL_SIZE'),
+    'connectTimeoutMS': _env_int('MONGO_CONNECT_TIMEOUT_MS'),
+    'serverSelectionTimeoutMS': _env_int('MONGO_SERVER_SELECTION_TIMEOUT_MS'),
+    'socketTimeoutMS': _env_int('MONGO_SOCKET_TIMEOUT_MS'),
+    'read_preference': os.environ.get('MONGO_READ_PREFERENCE', 'secondaryPreferred'),
+    'bulk_write_concern': os.environ.get('MONGO_BULK_WRITE_CONCERN'),
+}
+
+# Client options that are passed to MongoClient when they are set
+CLIENT_OPTIONS = ('maxPoolSize', 'minPoolSize', 'connectTimeoutMS', 'serverSelectionTimeoutMS', 'socketTimeoutMS')
+
+_client = None
+_lock = threading.Lock()
+_listeners = []
+
+
+def configure(**settings):
+    """
+    Overrides settings; must be called before the first use of the client.
+    """
+    if _client is not None:
+        raise RuntimeError("MongoDB client is already open")
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown connection settings: {', '.join(sorted(unknown))}")
+    SETTINGS.update(settings)
+
+
+def add_listener(listener):
+    """
+    Registers a pymongo event listener for the client (before its first use).
+    """
+    if _client is not None:
+        raise RuntimeError("MongoDB client is already open")
+    _listeners.append(listener)
+
+
+def client_options():
+    """
+    Pool and timeout keyword arguments for MongoClient (or an async client, see api.py).
+    """
+    return {key: SETTINGS[key] for key in CLIENT_OPTIONS if SETTINGS[key] is not None}
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(SETTINGS['uri'], event_listeners=list(_listeners), **client_options())
+    return _client
+
+
+def get_db():
+    return get_client()[SETTINGS['db']]
+
+
+def read_preference():
+    """
+    Read preference for read-only display queries.
+    """
+    name = SETTINGS['read_preference']
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {name}")
+    return READ_PREFERENCES[name]
+
+
+def bulk_write_concern():
+    """
+    Write concern for batch write paths, or None to use the client's.
+    """
+    w = SETTINGS['bulk_write_concern']
+    if not w:
+        return None
+    return WriteConcern(w=int(w) if str(w).isdigit() else w)
+
+
+class LazyCollection:
+    """
+    Stands in for a collection and resolves it (opening the client) on first use.
+    """
+
+    def __init__(self, name, **options):
+        self._name = name
+        self._options = options
+        self._collection = None
+
+    def _resolve(self):
+        if self._collection is None:
+            self._collection = get_db().get_collection(self._name, **self._options)
+        return self._collection
+
+    def with_options(self, **options):
+        return LazyCollection(self._name, **{**self._options, **options})
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+
+class LazyDatabase:
+    """
+    Stands in for the tv_store database; collections are resolved on first use.
+    """
+
+    def __getitem__(self, name):
+        return LazyCollection(name)
+
+    def get_collection(self, name, **options):
+        return LazyCollection(name, **options)
+
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
@@ -0,0 +1,219 @@
+import os
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Crawler engine for import.py
+# Pages are fetched by a pluggable fetcher: any callable url -> FetchResult.
+# The default one uses a pooled keep-alive requests.Session.
+
+FetchResult = namedtuple('FetchResult', ['url', 'status', 'content', 'headers'])
+
+# Status codes worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Status codes that mean the listing has no such page
+END_STATUSES = {404, 410}
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+
+class CrawlError(Exception):
+    """
+    Raised when pages of a listing could not be fetched (after retries).
+
+    Attributes:
+        pages: page number -> list of items, for the pages that were fetched.
+        failures: page number -> description of the failure.
+    """
+
+    def __init__(self, pages, failures):
+        self.pages = pages
+        self.failures = failures
+        summary = ", ".join(f"page {page}: {reason}" for page, reason in sorted(failures.items()))
+        super().__init__(f"{len(failures)} pages failed ({summary})")
+
+
+class RateLimiter:
+    """
+    Allows at most `rate` requests per second to each host, shared by all worker threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def acquire(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size=10):
+    """
+    Returns a requests.Session that keeps up to pool_size connections per host alive.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+class SessionFetcher:
+    """
+    Default fetcher: GET over a shared pooled session.
+    """
+
+    def __init__(self, session=None, timeout=30):
+        self.session = session or make_session()
+        self.timeout = timeout
+
+    def __call__(self, url, headers=None):
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        return FetchResult(url, response.status_code, response.content, response.headers)
+
+
+def fetch_with_retries(fetcher, url, retries=3, backoff=0.5, rate_limiter=None, headers=None):
+    """
+    Fetches a URL, retrying network errors and 429/5xx answers with exponential backoff.
+
+    Returns:
+        The last FetchResult.
+
+    Raises:
+        requests.exceptions.RequestException: If the last attempt failed with a network error.
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter:
+            rate_limiter.acquire(url)
+        try:
+            result = fetcher(url, headers=headers)
+            if result.status not in RETRY_STATUSES or attempt == retries:
+                return result
+        except requests.exceptions.RequestException:
+            if attempt == retries:
+                raise
+        # 0.5s, 1s, 2s, ... with some jitter so workers don't retry in lockstep
+        time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def page_url(url, page):
+    """
+    Returns the URL with its page= query parameter set to page.
+    """
+    parts = urlparse(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query['page'] = [str(page)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+
+def crawl_pages(url, parse, max_pages=25, workers=4, rate=2.0, retries=3, fetcher=None):
+    """
+    Walks the page= parameter of a listing URL with a bounded pool of workers.
+
+    Pages are requested concurrently; once a page has no items (or is not found)
+    no further pages are requested. Any other failure (an error status after retries,
+    e.g. a persistent 503 or a 403, or a network error) doesn't end the listing: the
+    remaining pages are still fetched and CrawlError is raised at the end.
+
+    Args:
+        url: Listing URL; its page= parameter is replaced for every page.
+        parse: Callable content -> list of items found on the page.
+        max_pages: Upper bound on pages to request.
+        workers: Number of pages fetched at the same time.
+        rate: Requests per second per host (0 disables the limit).
+        retries: Retries per page for network errors and 429/5xx answers.
+        fetcher: Callable (url, headers=None) -> FetchResult. Defaults to a pooled SessionFetcher.
+
+    Returns:
+        A dict page number -> list of items, for every page of the listing.
+
+    Raises:
+        CrawlError: If some pages before the end of the listing failed; it carries the pages
+            that were fetched.
+    """
+    fetcher = fetcher or SessionFetcher(make_session(pool_size=workers))
+    rate_limiter = RateLimiter(rate)
+    results = {}
+    failures = {}
+    last_page = max_pages
+
+    def fetch_page(page):
+        try:
+            result = fetch_with_retries(fetcher, page_url(url, page), retries, rate_limiter=rate_limiter)
+        except requests.exceptions.RequestException as e:
+            return page, None, str(e)
+        if result.status in END_STATUSES:
+            return page, [], None
+        if result.status != 200:
+            return page, None, f"HTTP {result.status}"
+        return page, parse(result.content), None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        next_page = 1
+        while pending or next_page <= last_page:
+            while len(pending) < workers and next_page <= last_page:
+                pending.add(executor.submit(fetch_page, next_page))
+                next_page += 1
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page, items, error = future.result()
+                if error:
+                    failures[page] = error
+                elif not items:
+                    last_page = min(last_page, page - 1)
+                else:
+                    results[page] = items
+
+    pages = {page: items for page, items in sorted(results.items()) if page <= last_page}
+    failures = {page: error for page, error in failures.items() if page <= last_page}
+    if failures:
+        raise CrawlError(pages, failures)
+    return pages
+
+
+# Local stand-in for benchmarks and tests
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    # Maps ...?page=N to page_N.html in the fixture directory
+    def translate_path(self, path):
+        match = re.search(r'[?&]page=(\d+)', path)
+        name = f"page_{match.group(1)}.html" if match else 'page_1.html'
+        return os.path.join(self.directory, name)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixtures(directory, port=0):
+    """
+    Serves saved listing pages (page_1.html, page_2.html, ...) over HTTP in a background thread.
+
+    Returns:
+        The server (call shutdown() when done) and its base URL.
+    """
+    handler = partial(_FixtureHandler, directory=os.path.abspath(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/listing?page=1"
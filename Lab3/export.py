@@ -0,0 +1,114 @@
+import argparse
+import gzip
+import json
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+
+import numpy as np
+
+import connection
+
+# Snapshot export for analysts, so reports never query the live collections
+# Usage:
+#   python export.py                      (writes exports/<timestamp>/)
+#   python export.py --out exports/latest
+# Every collection is streamed through a cursor into <collection>.jsonl.gz; products are
+# also written as columns to products.npz (uncompressed, so analytics.py can memory-map
+# the arrays). Reads use the MONGO_READ_PREFERENCE (secondaryPreferred by default).
+
+COLLECTIONS = {
+    'products': 'product_id',
+    'brands': 'brand_id',
+    'category': 'category_id',
+}
+
+# products.npz column -> (array typecode, numpy dtype, value for a missing field)
+COLUMNS = {
+    'product_id': ('q', np.int64, -1),
+    'price': ('d', np.float64, float('nan')),
+    'quantity': ('q', np.int64, 0),
+    'diagonal': ('d', np.float64, float('nan')),
+    'brand_id': ('q', np.int64, -1),
+    'category_id': ('q', np.int64, -1),
+}
+
+CURSOR_BATCH_SIZE = 5000
+
+
+def export_collection(collection, path, id_field, columns=None):
+    """
+    Streams a collection ordered by id into a gzip-compressed JSON Lines file.
+
+    Args:
+        collection: Source collection.
+        path: Target .jsonl.gz file.
+        id_field: Field the documents are ordered by.
+        columns: Optional dict column -> array.array; values of these fields are appended to it.
+
+    Returns:
+        Number of exported documents.
+    """
+    count = 0
+    cursor = collection.find({}, {"_id": 0}).sort(id_field, 1).batch_size(CURSOR_BATCH_SIZE)
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        for doc in cursor:
+            f.write(json.dumps(doc, default=str, ensure_ascii=False))
+            f.write('\n')
+            if columns is not None:
+                for name, values in columns.items():
+                    value = doc.get(name)
+                    if value is None:
+                        values.append(COLUMNS[name][2])
+                    else:
+                        values.append(float(value) if values.typecode == 'd' else int(value))
+            count += 1
+    return count
+
+
+def write_columns(path, columns):
+    # np.savez stores the members uncompressed (ZIP_STORED), which is what makes them mappable
+    np.savez(path, **{name: np.frombuffer(values, dtype=COLUMNS[name][1]) for name, values in columns.items()})
+
+
+def export_catalog(db, directory):
+    """
+    Writes products.jsonl.gz, brands.jsonl.gz, category.jsonl.gz and products.npz.
+
+    Returns:
+        A dict collection name -> number of exported documents.
+    """
+    os.makedirs(directory, exist_ok=True)
+    read_preference = connection.read_preference()
+    counts = {}
+    for name, id_field in COLLECTIONS.items():
+        started = time.perf_counter()
+        collection = db.get_collection(name, read_preference=read_preference)
+        columns = {column: array(typecode) for column, (typecode, _, _) in COLUMNS.items()} if name == 'products' else None
+        counts[name] = export_collection(collection, os.path.join(directory, f"{name}.jsonl.gz"), id_field, columns)
+        if columns is not None:
+            write_columns(os.path.join(directory, 'products.npz'), columns)
+        print(f"{name}: {counts[name]} documents in {time.perf_counter() - started:.2f}s")
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump({"exported_at": datetime.now(timezone.utc).isoformat(), "counts": counts,
+                   "columns": list(COLUMNS)}, f, indent=2)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog to JSON Lines and a NumPy snapshot")
+    parser.add_argument('--out', help="Target directory (default: exports/<timestamp>)")
+    parser.add_argument('--uri', default=connection.SETTINGS['uri'])
+    parser.add_argument('--db', default=connection.SETTINGS['db'])
+    args = parser.parse_args()
+
+    connection.configure(uri=args.uri, db=args.db)
+    directory = args.out or os.path.join('exports', f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}")
+    export_catalog(connection.get_db(), directory)
+    print(f"Snapshot written to {directory}")
+
+
+if __name__ == '__main__':
+    main()
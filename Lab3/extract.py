@@ -0,0 +1,166 @@
+import argparse
+import glob
+import os
+import re
+import time
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# HTML extraction backends for listing pages
+# Every backend takes the page HTML and returns a list of (title, price_text) pairs
+# for the gridview-item blocks. The fastest installed one is used by default:
+# selectolax, then lxml, then BeautifulSoup restricted to the product blocks.
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# Changes whenever the extracted rows change for the same HTML, so cached parses are redone
+EXTRACT_VERSION = 2
+
+# "$1,299.99", "Now $849.00" -> the first number in the text
+PRICE_RE = re.compile(r'\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?')
+
+CONTAINER_XPATH = "//div[contains(concat(' ', normalize-space(@class), ' '), ' gridview-item ')]"
+TITLE_XPATH = ".//a[contains(concat(' ', normalize-space(@class), ' '), ' product-title-link ')]"
+PRICE_XPATH = ".//span[contains(concat(' ', normalize-space(@class), ' '), ' price ')]"
+# SoupStrainer of bs4 4.13+ compares a plain class_ string with the whole class attribute
+CONTAINER_CLASS_RE = re.compile(r'(^|\s)gridview-item(\s|$)')
+
+
+def parse_price(price_text):
+    """
+    Returns the numeric value of a price text, or None if there is no number in it.
+    """
+    if not price_text:
+        return None
+    match = PRICE_RE.search(price_text)
+    if not match:
+        return None
+    return float(match.group().replace(',', ''))
+
+
+def _clean(text):
+    # Text nodes are joined with spaces in every backend, then runs of whitespace collapsed,
+    # so all backends return the same title for the same markup
+    return ' '.join(text.split())
+
+
+def _extract_selectolax(content):
+    rows = []
+    for container in HTMLParser(content).css('div.gridview-item'):
+        title = container.css_first('a.product-title-link')
+        price = container.css_first('span.price')
+        if title is None or price is None:
+            continue
+        rows.append((_clean(title.text(separator=' ', strip=True)), _clean(price.text(separator=' ', strip=True))))
+    return rows
+
+
+def _extract_lxml(content):
+    rows = []
+    if not content.strip():
+        return rows
+    for container in lxml.html.fromstring(content).xpath(CONTAINER_XPATH):
+        title = container.xpath(TITLE_XPATH)
+        price = container.xpath(PRICE_XPATH)
+        if not title or not price:
+            continue
+        rows.append((_clean(' '.join(title[0].itertext())), _clean(' '.join(price[0].itertext()))))
+    return rows
+
+
+def _extract_soup(content, parse_only=None):
+    rows = []
+    soup = BeautifulSoup(content, 'html.parser', parse_only=parse_only)
+    for container in soup.find_all('div', class_=CONTAINER_CLASS_RE):
+        title = container.find('a', class_='product-title-link')
+        price = container.find('span', class_='price')
+        if title is None or price is None:
+            continue
+        rows.append((_clean(title.get_text(' ')), _clean(price.get_text(' '))))
+    return rows
+
+
+def _extract_soupstrainer(content):
+    # Only the product blocks are turned into a tree
+    return _extract_soup(content, SoupStrainer('div', class_=CONTAINER_CLASS_RE))
+
+
+# name -> extractor, fastest first; 'soup' is the old full-tree parse, kept for comparison
+BACKENDS = {}
+if HTMLParser is not None:
+    BACKENDS['selectolax'] = _extract_selectolax
+if lxml is not None:
+    BACKENDS['lxml'] = _extract_lxml
+BACKENDS['soupstrainer'] = _extract_soupstrainer
+BACKENDS['soup'] = _extract_soup
+
+
+def extract_products(content, backend=None):
+    """
+    Extracts products from the HTML of one listing page.
+
+    Args:
+        content: The HTML of the page (bytes or str).
+        backend: Name of a backend from BACKENDS; the fastest available one if None.
+
+    Returns:
+        A list of dictionaries with title, price text and numeric price_value.
+    """
+    extractor = BACKENDS[backend] if backend else next(iter(BACKENDS.values()))
+    return [
+        {
+            'title': title,
+            'price': price_text,
+            'price_value': parse_price(price_text),
+            'rating': None,  # Placeholder, can be populated if reviews page is followed
+            'reviews': None,  # Placeholder, can be populated if reviews page is followed
+        }
+        for title, price_text in extractor(content)
+    ]
+
+
+def benchmark(corpus_dir, backends=None, repeat=3):
+    """
+    Runs every backend over all *.html files in a directory.
+
+    Returns:
+        A dict backend name -> pages per second (best of `repeat` runs).
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(corpus_dir, '*.html'))):
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    if not pages:
+        raise ValueError(f"No .html files in {corpus_dir}")
+
+    results = {}
+    for name in backends or BACKENDS:
+        extractor = BACKENDS[name]
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for content in pages:
+                extractor(content)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = len(pages) / best if best else float('inf')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare HTML extraction backends on stored pages")
+    parser.add_argument('corpus', help="Directory with saved listing pages (*.html)")
+    parser.add_argument('--backend', action='append', choices=list(BACKENDS), help="Backend to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for name, rate in benchmark(args.corpus, args.backend, args.repeat).items():
+        print(f"{name:>12}: {rate:10.1f} pages/sec")
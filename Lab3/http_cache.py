@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+
+from crawler import FetchResult
+
+# On-disk HTTP cache for incremental scraping
+#   <dir>/pages/<sha256(url)>.json   - ETag, Last-Modified and content hash of the last response
+#   <dir>/pages/<sha256(url)>.html   - the last response body
+#   <dir>/parsed/<sha256(body)>.json - products extracted from a body, so unchanged pages are not parsed again
+
+
+def _sha256(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path, data, mode='wb'):
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class HttpCache:
+    def __init__(self, directory='.http_cache'):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'pages'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'parsed'), exist_ok=True)
+
+    def _page_path(self, url, extension):
+        return os.path.join(self.directory, 'pages', f"{_sha256(url)}.{extension}")
+
+    def get(self, url):
+        """
+        Returns the stored metadata of a URL, or None if it was never fetched.
+        """
+        try:
+            with open(self._page_path(url, 'json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def body(self, url):
+        with open(self._page_path(url, 'html'), 'rb') as f:
+            return f.read()
+
+    def store(self, url, result):
+        _write_atomic(self._page_path(url, 'html'), result.content)
+        meta = {
+            'url': url,
+            'etag': result.headers.get('ETag'),
+            'last_modified': result.headers.get('Last-Modified'),
+            'content_hash': _sha256(result.content),
+        }
+        _write_atomic(self._page_path(url, 'json'), json.dumps(meta), 'w')
+
+    def conditional_headers(self, url):
+        meta = self.get(url)
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def get_parsed(self, content_hash):
+        try:
+            with open(os.path.join(self.directory, 'parsed', f"{content_hash}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def store_parsed(self, content_hash, items):
+        _write_atomic(os.path.join(self.directory, 'parsed', f"{content_hash}.json"), json.dumps(items), 'w')
+
+
+class CachingFetcher:
+    """
+    Wraps a fetcher with conditional GETs. A 304 answer is returned as a 200 with the cached body.
+    """
+
+    def __init__(self, fetcher, cache):
+        self.fetcher = fetcher
+        self.cache = cache
+        self.not_modified = 0
+        self.downloaded = 0
+
+    def __call__(self, url, headers=None):
+        headers = {**(headers or {}), **self.cache.conditional_headers(url)}
+        result = self.fetcher(url, headers=headers)
+
+        if result.status == 304:
+            self.not_modified += 1
+            return FetchResult(url, 200, self.cache.body(url), result.headers)
+        if result.status == 200:
+            self.downloaded += 1
+            self.cache.store(url, result)
+        return result
+
+
+class CachedParser:
+    """
+    Wraps a parse function so a page body that was parsed before is looked up by its hash.
+    """
+
+    def __init__(self, parse, cache, version=None):
+        """
+        Args:
+            parse: Callable content -> list of items.
+            cache: HttpCache the items are kept in.
+            version: Version of the parse function; items parsed by another version are not reused.
+        """
+        self.parse = parse
+        self.cache = cache
+        self.version = version
+        self.parsed = 0
+        self.skipped = 0
+
+    def __call__(self, content):
+        content_hash = _sha256(content)
+        if self.version is not None:
+            content_hash = f"{self.version}-{content_hash}"
+        items = self.cache.get_parsed(content_hash)
+        if items is not None:
+            self.skipped += 1
+            return items
+
+        self.parsed += 1
+        items = self.parse(content)
+        self.cache.store_parsed(content_hash, items)
+        return items
+
+
+def _row_key(product):
+    return json.dumps(product, sort_keys=True, default=str)
+
+
+def diff_products(previous, current):
+    """
+    Returns the products of `current` that are new or differ from every product in `previous`.
+
+    Whole rows are compared as a multiset, so several products with the same title don't show up as
+    changed when they are all unchanged.
+    """
+    unmatched = Counter(_row_key(product) for product in previous)
+    delta = []
+    for product in current:
+        row = _row_key(product)
+        if unmatched[row]:
+            unmatched[row] -= 1
+        else:
+            delta.append(product)
+    return delta
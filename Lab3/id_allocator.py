@@ -0,0 +1,129 @@
+from pymongo import ReturnDocument, UpdateOne
+
+# ID allocator
+# Every collection gets one counter document in the "counters" collection:
+#   {"_id": "products", "seq": <last issued id>}
+# IDs are handed out with a single atomic find-and-modify, so concurrent
+# writers never get the same ID and no collection scan is needed.
+# With RECYCLE_IDS, IDs released by deletes are kept one document per ID in "free_ids"
+#   {"_id": "products:105", "counter": "products", "id": 105}
+# and the smallest one is claimed with find_one_and_delete before a new ID is issued.
+
+COUNTERS_COLLECTION = 'counters'
+FREE_IDS_COLLECTION = 'free_ids'
+
+# Reuse IDs released by remove_* before issuing new ones. Off by default: a reused ID makes
+# old links (e.g. /products/<id> of api.py) point to a different product.
+RECYCLE_IDS = False
+
+# IDs checked per query when the free list is cleaned up
+SYNC_BATCH_SIZE = 1000
+
+
+def _ensure_counter(db, counter_name, collection, id_field, start):
+    """
+    Creates the counter document on first use, seeded from the largest existing ID.
+
+    Uses $max with upsert, so several processes seeding at the same time end up
+    with the same value and an existing counter is never moved backwards.
+    """
+    if db[COUNTERS_COLLECTION].find_one({"_id": counter_name}, {"_id": 1}) is None:
+        sync_counter(db, counter_name, collection, id_field, start)
+
+
+def allocate_id(db, counter_name, collection, id_field, start=0):
+    """
+    Returns a free ID for the collection in O(1) round trips.
+
+    Args:
+        db: The database holding the collection and the counters.
+        counter_name: Name of the counter document (usually the collection name).
+        collection: The collection the ID is allocated for.
+        id_field: Name of the ID field, e.g. "product_id".
+        start: The first ID handed out for an empty collection.
+
+    Returns:
+        The allocated integer ID.
+    """
+    _ensure_counter(db, counter_name, collection, id_field, start)
+    counters = db[COUNTERS_COLLECTION]
+
+    while RECYCLE_IDS:
+        # Claim the smallest recycled ID, if there is one
+        free = db[FREE_IDS_COLLECTION].find_one_and_delete({"counter": counter_name}, sort=[("id", 1)])
+        if free is None:
+            break
+        # An import may have brought the ID back since it was released
+        if collection.count_documents({id_field: free["id"]}, limit=1) == 0:
+            return free["id"]
+
+    counter = counters.find_one_and_update(
+        {"_id": counter_name},
+        {"$inc": {"seq": 1}},
+        projection={"seq": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+
+def reserve_ids(db, counter_name, collection, id_field, count, start=0):
+    """
+    Reserves a contiguous block of IDs in one call, for bulk loaders.
+
+    Returns:
+        A range of the reserved IDs.
+    """
+    if count <= 0:
+        return range(0)
+
+    _ensure_counter(db, counter_name, collection, id_field, start)
+    counter = db[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": counter_name},
+        {"$inc": {"seq": count}},
+        projection={"seq": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return range(counter["seq"] - count + 1, counter["seq"] + 1)
+
+
+def release_ids(db, counter_name, ids):
+    """
+    Puts IDs of removed documents on the free list so they can be reused.
+    """
+    if not RECYCLE_IDS or not ids:
+        return
+
+    requests = [UpdateOne({"_id": f"{counter_name}:{doc_id}"},
+                          {"$setOnInsert": {"counter": counter_name, "id": doc_id}}, upsert=True)
+                for doc_id in ids]
+    db[FREE_IDS_COLLECTION].bulk_write(requests, ordered=False)
+
+
+def sync_counter(db, counter_name, collection, id_field, start=0):
+    """
+    Moves the counter past the largest existing ID and drops recycled IDs that are
+    in use again (e.g. after an external import).
+    """
+    last = collection.find_one({}, {id_field: 1, "_id": 0}, sort=[(id_field, -1)])
+    seq = max(last[id_field] if last else start - 1, start - 1)
+    db[COUNTERS_COLLECTION].update_one(
+        {"_id": counter_name},
+        # "free" is the array the free list used to be kept in
+        {"$max": {"seq": seq}, "$unset": {"free": ""}},
+        upsert=True
+    )
+
+    free_ids = db[FREE_IDS_COLLECTION]
+    batch = []
+    for free in free_ids.find({"counter": counter_name}, {"id": 1}).sort("id", 1):
+        batch.append(free["id"])
+        if len(batch) >= SYNC_BATCH_SIZE:
+            _drop_taken(free_ids, counter_name, collection, id_field, batch)
+            batch = []
+    _drop_taken(free_ids, counter_name, collection, id_field, batch)
+
+
+def _drop_taken(free_ids, counter_name, collection, id_field, ids):
+    taken = collection.distinct(id_field, {id_field: {"$in": ids}}) if ids else []
+    if taken:
+        free_ids.delete_many({"counter": counter_name, "id": {"$in": taken}})
@@ -1,51 +1,51 @@
-import requests
-from bs4 import BeautifulSoup
+import argparse
 import json
+import os
+import sys
+import time
+
+import requests
+
+from crawler import CrawlError, SessionFetcher, crawl_pages, make_session, serve_fixtures
+from extract import BACKENDS, EXTRACT_VERSION, extract_products
+from http_cache import CachedParser, CachingFetcher, HttpCache, diff_products
+
+# HTML extraction backend, see extract.py (None - fastest installed)
+EXTRACT_BACKEND = None
+
+WALMART_URL = "https://www.walmart.com/shop/deals/electronics/tvs?seo=deals&seo=electronics&seo=tvs&page=1&affinityOverride=default"
+
+def parse_listing(content):
+    """
+    Extracts basic product information from the HTML of one listing page.
+
+    Args:
+        content: The HTML of the page (bytes or str).
 
-def scrape_walmart_tvs(url):
+    Returns:
+        A list of dictionaries containing scraped product data.
+    """
+    # Information like rating and reviews might not be readily available on the listing page and might require following product links
+    return extract_products(content, EXTRACT_BACKEND)
+
+def scrape_walmart_tvs(url, fetcher=None):
     """
     Scrapes data from a Walmart TV product listing page and returns a list of dictionaries containing basic product information.
 
     Args:
         url: The URL of the Walmart TV product listing page.
+        fetcher: Optional callable (url, headers=None) -> FetchResult, see crawler.py.
 
     Returns:
         A list of dictionaries containing scraped product data, or None if scraping fails.
     """
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Find all product containers on the page
-        product_containers = soup.find_all('div', class_='gridview-item')
-
-        # Extract data from each product container
-        products = []
-        for container in product_containers:
-            try:
-                title_element = container.find('a', class_='product-title-link')
-                title = title_element.text.strip()
-
-                # Extract price using regex or more robust methods (price format might change)
-                price_element = container.find('span', class_='price')
-                price_text = price_element.text.strip()
-                # You can use regular expressions here to extract the numeric value from the price text
-
-                # Information like rating and reviews might not be readily available on the listing page and might require following product links
-                products.append({
-                    'title': title,
-                    'price': price_text,
-                    'rating': None,  # Placeholder, can be populated if reviews page is followed
-                    'reviews': None,  # Placeholder, can be populated if reviews page is followed
-                })
-            except AttributeError:
-                # Skip products with missing data
-                pass
-
-        return products
+        result = (fetcher or SessionFetcher())(url)
+        if result.status >= 400:
+            raise requests.exceptions.HTTPError(f"{result.status} for url: {url}")
+
+        return parse_listing(result.content)
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching URL: {e}")
@@ -54,17 +54,82 @@ def scrape_walmart_tvs(url):
         print(f"Error parsing HTML: {e}")
         return None
 
+def crawl_walmart_tvs(url, max_pages=25, workers=4, rate=2.0, fetcher=None, cache=None):
+    """
+    Scrapes all pages of a Walmart TV listing concurrently.
+
+    Args:
+        url: The URL of the first listing page.
+        max_pages: Upper bound on the number of pages.
+        workers: Number of pages fetched at the same time.
+        rate: Requests per second to the site.
+        fetcher: Optional callable (url, headers=None) -> FetchResult, see crawler.py.
+        cache: Optional HttpCache; pages are then fetched with conditional GETs and
+            bodies that were parsed before are not parsed again.
+
+    Returns:
+        A list of dictionaries containing scraped product data, in page order.
+
+    Raises:
+        CrawlError: If pages could not be fetched, see crawler.crawl_pages.
+    """
+    parse = parse_listing
+    if cache:
+        fetcher = CachingFetcher(fetcher or SessionFetcher(make_session(pool_size=workers)), cache)
+        parse = CachedParser(parse_listing, cache, version=EXTRACT_VERSION)
+
+    pages = crawl_pages(url, parse, max_pages=max_pages, workers=workers, rate=rate, fetcher=fetcher)
+
+    if cache:
+        print(f"Pages downloaded: {fetcher.downloaded}, not modified: {fetcher.not_modified}, "
+              f"parsed: {parse.parsed}, parse skipped: {parse.skipped}")
+    return [product for page in pages.values() for product in page]
+
 if __name__ == "__main__":
-    # Walmart TV listing page URL
-    walmart_url = "https://www.walmart.com/shop/deals/electronics/tvs?seo=deals&seo=electronics&seo=tvs&page=1&affinityOverride=default"
+    parser = argparse.ArgumentParser(description="Scrape TV listings")
+    parser.add_argument('--url', default=WALMART_URL, help="Walmart TV listing page URL")
+    parser.add_argument('--pages', type=int, default=25, help="Maximum number of pages")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=2.0, help="Requests per second (0 - no limit)")
+    parser.add_argument('--backend', choices=list(BACKENDS), help="HTML extraction backend")
+    parser.add_argument('--fixtures', help="Crawl saved pages (page_1.html, ...) from this directory via a local server")
+    parser.add_argument('--cache-dir', default='.http_cache', help="Directory of the HTTP response cache")
+    parser.add_argument('--no-cache', action='store_true', help="Download and parse every page again")
+    args = parser.parse_args()
+    EXTRACT_BACKEND = args.backend
 
-    tv_data = scrape_walmart_tvs(walmart_url)
+    server = None
+    if args.fixtures:
+        server, args.url = serve_fixtures(args.fixtures)
+
+    started = time.perf_counter()
+    cache = None if args.no_cache else HttpCache(args.cache_dir)
+    try:
+        tv_data = crawl_walmart_tvs(args.url, args.pages, args.workers, args.rate, cache=cache)
+    except CrawlError as e:
+        # A partial crawl would make the next run report the missing products as new
+        print(f"Crawl incomplete, nothing saved: {e}")
+        sys.exit(1)
+    finally:
+        if server:
+            server.shutdown()
+    elapsed = time.perf_counter() - started
+    print(f"Crawled {len(tv_data)} products in {elapsed:.2f}s")
     
     if tv_data:
+        # Only new products and products whose data changed since the last run
+        previous = []
+        if os.path.exists('products_raw.json'):
+            with open('products_raw.json') as f:
+                previous = json.load(f)
+        delta = diff_products(previous, tv_data)
+
         # Print the list of dictionaries
-        print(json.dumps(tv_data, indent=4))
+        print(json.dumps(delta, indent=4))
 
-        # Optionally, save the data to a file
-        with open('products_raw.json', 'x') as f:
+        # Save the full snapshot for the next run and the delta feed for the DB
+        with open('products_raw.json', 'w') as f:
             json.dump(tv_data, f, indent=4)
-        print("Data from website is scrapped!")
\ No newline at end of file
+        with open('products_delta.json', 'w') as f:
+            json.dump(delta, f, indent=4)
+        print(f"Data from website is scrapped! {len(delta)} new or changed products in products_delta.json")
\ No newline at end of file
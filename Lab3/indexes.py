@@ -0,0 +1,117 @@
+from pymongo import ASCENDING, DESCENDING, TEXT
+
+# Index manager
+# Declares the indexes every query in main.py relies on, creates missing ones at
+# startup and checks with explain() that the queries actually use them.
+
+# collection name -> list of (keys, options)
+REQUIRED_INDEXES = {
+    'products': [
+        ([("product_id", ASCENDING)], {"unique": True}),
+        ([("category_id", ASCENDING), ("product_id", ASCENDING)], {}),
+        ([("brand_id", ASCENDING), ("product_id", ASCENDING)], {}),
+        # Filters by brand/category with diagonal and price ranges (filter_with_facets)
+        ([("brand_id", ASCENDING), ("diagonal", ASCENDING), ("price", ASCENDING)], {}),
+        ([("category_id", ASCENDING), ("diagonal", ASCENDING), ("price", ASCENDING)], {}),
+        ([("diagonal", ASCENDING), ("price", ASCENDING)], {}),
+        ([("price", ASCENDING)], {}),
+        # Product search (search.py)
+        ([("name", TEXT), ("description", TEXT)], {"weights": {"name": 10, "description": 1}}),
+    ],
+    'brands': [
+        ([("brand_id", ASCENDING)], {"unique": True}),
+    ],
+    'category': [
+        ([("category_id", ASCENDING)], {"unique": True}),
+    ],
+    # Claiming the smallest recycled ID (id_allocator.py)
+    'free_ids': [
+        ([("counter", ASCENDING), ("id", ASCENDING)], {}),
+    ],
+}
+
+# Query shapes issued by the menus: (collection name, filter, sort)
+# Sample values are fine, explain() only looks at the plan.
+MENU_QUERIES = [
+    ('products', {}, [("product_id", ASCENDING)]),
+    ('products', {"product_id": 0}, None),
+    ('products', {"category_id": 0}, [("product_id", ASCENDING)]),
+    ('products', {"brand_id": 0}, [("product_id", ASCENDING)]),
+    ('products', {}, [("product_id", DESCENDING)]),
+    ('brands', {}, [("brand_id", ASCENDING)]),
+    ('brands', {"brand_id": 0}, None),
+    ('brands', {}, [("brand_id", DESCENDING)]),
+    ('category', {}, [("category_id", ASCENDING)]),
+    ('category', {"category_id": 0}, None),
+    ('category', {}, [("category_id", DESCENDING)]),
+]
+
+# Plan stages that mean the query is not served by an index
+BAD_STAGES = {'COLLSCAN', 'SORT'}
+
+
+class QueryPlanError(RuntimeError):
+    pass
+
+
+def _index_name(keys):
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+def ensure_indexes(db, required=None):
+    """
+    Creates the declared indexes that are missing. Safe to call on every start.
+
+    Returns:
+        A list of names of the indexes that were created.
+    """
+    created = []
+    for collection_name, indexes in (required or REQUIRED_INDEXES).items():
+        collection = db[collection_name]
+        index_information = collection.index_information()
+        existing = {tuple(info['key']) for info in index_information.values()}
+        for keys, options in indexes:
+            # Text indexes are stored under different keys, so check their name as well
+            if tuple(keys) in existing or _index_name(keys) in index_information:
+                continue
+            created.append(collection.create_index(keys, name=_index_name(keys), **options))
+    return created
+
+
+def _plan_stages(plan):
+    # Walks the nested explain output and yields every stage name
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def explain_query(db, collection_name, query, sort=None):
+    """
+    Returns the set of stages in the winning plan of a query.
+    """
+    cursor = db[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return set(_plan_stages(cursor.explain()['queryPlanner']['winningPlan']))
+
+
+def verify_query_plans(db, queries=None):
+    """
+    Checks that every menu query is served by an index.
+
+    Raises:
+        QueryPlanError: If any plan contains a collection scan or an in-memory sort.
+    """
+    problems = []
+    for collection_name, query, sort in (queries or MENU_QUERIES):
+        bad = explain_query(db, collection_name, query, sort) & BAD_STAGES
+        if bad:
+            problems.append(f"{collection_name}.find({query}) sort={sort}: {', '.join(sorted(bad))}")
+
+    if problems:
+        raise QueryPlanError("Query plans without index:\n  " + "\n  ".join(problems))
@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+
+import connection
+import storage
+from extract import parse_price
+
+# Loads scraped listing rows (products_delta.json / products_raw.json from import.py) into products
+# Usage:
+#   python ingest.py                          (the delta of the last crawl)
+#   python ingest.py products_raw.json        (a full crawl)
+#   python ingest.py --dry-run
+# Every row is normalized into a product document: the price is parsed, the diagonal is taken
+# from the title and brand_id / category_id are resolved by name. Products are matched by a
+# hash of their normalized title; only new products and changed prices are written.
+# All lookups go to in-memory indexes built with one read per collection, so a crawl is
+# ingested in linear time without a query per row. Writes go through the repositories of the
+# configured storage backend (STORAGE_BACKEND), which batch them into unordered bulk writes
+# and keep the inventory statistics and collection versions in sync.
+
+DEFAULT_PATH = 'products_delta.json'
+
+# 55", 65'', 43”, 50-Inch, 75 in., 65" Class, 55 Class
+DIAGONAL_RE = re.compile(
+    r'(\d{2,3}(?:\.\d+)?)\s*(?:"|\'\'|”|″|-?\s*inch(?:es)?\b|in\b\.?|(?=\s*class\b))', re.IGNORECASE)
+# Inch marks are folded into " in" before the punctuation is dropped, so 55" and 55-Inch match
+INCH_RE = re.compile(r'(\d)\s*(?:"|\'\'|”|″|-?\s*inch(?:es)?\b)', re.IGNORECASE)
+NON_WORD_RE = re.compile(r'[^\w.]+|\.(?!\d)')
+
+INDEX_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1}
+
+
+def normalize_title(title):
+    """
+    Lower-case title with unified inch marks and without punctuation or repeated spaces.
+    """
+    title = INCH_RE.sub(r'\1 in ', title.lower())
+    return ' '.join(NON_WORD_RE.sub(' ', title).split())
+
+
+def title_key(title):
+    """
+    Hash of the normalized title, the key products are matched by (8 bytes per indexed product).
+    """
+    return hashlib.blake2b(normalize_title(title).encode(), digest_size=8).digest()
+
+
+def parse_diagonal(title):
+    """
+    Screen size in inches from a title, or None.
+    """
+    match = DIAGONAL_RE.search(title)
+    return float(match.group(1)) if match else None
+
+
+class NameIndex:
+    """
+    Resolves brand or category names mentioned in a title.
+
+    Names are looked up as word n-grams of the normalized title; a name at the start of the
+    title wins (listings start with the brand), otherwise the longest name found in it.
+    """
+
+    def __init__(self, docs, id_field, name_field):
+        self.ids = {}
+        for doc in docs:
+            name = normalize_title(doc.get(name_field) or '')
+            if name:
+                self.ids[name] = doc[id_field]
+        self.max_words = max((name.count(' ') + 1 for name in self.ids), default=0)
+
+    def resolve(self, normalized_title):
+        words = normalized_title.split()
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            doc_id = self.ids.get(' '.join(words[:size]))
+            if doc_id is not None:
+                return doc_id
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(1, len(words) - size + 1):
+                doc_id = self.ids.get(' '.join(words[start:start + size]))
+                if doc_id is not None:
+                    return doc_id
+        return None
+
+
+def load_rows(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_product_index(products):
+    """
+    title key -> (product_id, price) over all products, read in one pass.
+    """
+    index = {}
+    for product in products.find_page({}, INDEX_PROJECTION, limit=0, batch_size=5000):
+        if product.get("name"):
+            index[title_key(product["name"])] = (product["product_id"], product.get("price"))
+    return index
+
+
+def parse_row(row):
+    """
+    Title and numeric price of a scraped row.
+
+    Returns:
+        (title, price, None), or (None, None, reason) if the row can't be used.
+    """
+    title = (row.get('title') or '').strip()
+    if not title:
+        return None, None, "no title"
+    price = row.get('price_value')
+    if price is None:
+        price = parse_price(row.get('price'))
+    if price is None:
+        return None, None, "no price"
+    return title, price, None
+
+
+def new_product(row, title, price, brands, categories):
+    """
+    Product document for a scraped row that matches no existing product.
+
+    Returns:
+        (document, None), or (None, reason) if the brand or category isn't known.
+    """
+    normalized = normalize_title(title)
+    brand_id = brands.resolve(normalized)
+    if brand_id is None:
+        return None, "unknown brand"
+    category_id = categories.resolve(normalized)
+    if category_id is None:
+        return None, "unknown category"
+
+    doc = {
+        "name": title,
+        "price": price,
+        # Scraped listings say nothing about our own stock
+        "quantity": 0,
+        "diagonal": parse_diagonal(title),
+        "description": "",
+        "brand_id": brand_id,
+        "category_id": category_id,
+    }
+    for field in ('rating', 'reviews'):
+        if row.get(field) is not None:
+            doc[field] = row[field]
+    return doc, None
+
+
+def plan_ingest(rows, product_index, brands, categories):
+    """
+    Splits scraped rows into new products and price changes of existing ones.
+
+    Rows with the same title are collapsed into the last one.
+
+    Returns:
+        (new_docs, price_updates {product_id: {"price": price}}, ids of unchanged products,
+        skipped Counter reason -> rows).
+    """
+    new_docs = {}
+    price_updates = {}
+    unchanged = set()
+    skipped = Counter()
+    for row in rows:
+        title, price, reason = parse_row(row)
+        if reason:
+            skipped[reason] += 1
+            continue
+        key = title_key(title)
+        existing = product_index.get(key)
+        if existing is None:
+            doc, reason = new_product(row, title, price, brands, categories)
+            if reason:
+                skipped[reason] += 1
+            else:
+                new_docs[key] = doc
+        elif existing[1] != price:
+            price_updates[existing[0]] = {"price": price}
+            unchanged.discard(existing[0])
+        else:
+            price_updates.pop(existing[0], None)
+            unchanged.add(existing[0])
+    return list(new_docs.values()), price_updates, unchanged, skipped
+
+
+def ingest(backend, rows, dry_run=False):
+    """
+    Inserts new products and updates changed prices.
+
+    Returns:
+        A dict with the "inserted", "updated" and "unchanged" counts and "skipped" (reason -> rows).
+    """
+    brands = NameIndex(backend.brands.all(), 'brand_id', 'brand_name')
+    categories = NameIndex(backend.categories.all(), 'category_id', 'category_name')
+    product_index = build_product_index(backend.products)
+
+    new_docs, price_updates, unchanged, skipped = plan_ingest(rows, product_index, brands, categories)
+    if not dry_run:
+        backend.products.create_many(new_docs)
+        backend.products.update_many_by_id(price_updates)
+    return {
+        "inserted": len(new_docs),
+        "updated": len(price_updates),
+        "unchanged": len(unchanged),
+        "skipped": dict(skipped),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load scraped products into the catalog")
+    parser.add_argument('path', nargs='?', default=DEFAULT_PATH, help="Rows written by import.py")
+    parser.add_argument('--uri', default=connection.SETTINGS['uri'])
+    parser.add_argument('--db', default=connection.SETTINGS['db'])
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be written")
+    args = parser.parse_args()
+
+    connection.configure(uri=args.uri, db=args.db)
+    backend = storage.open_backend()
+    try:
+        started = time.perf_counter()
+        rows = load_rows(args.path)
+        result = ingest(backend, rows, args.dry_run)
+        elapsed = time.perf_counter() - started
+        print(f"{len(rows)} rows in {elapsed:.2f}s: {result['inserted']} new products, "
+              f"{result['updated']} price changes, {result['unchanged']} unchanged"
+              + (" (dry run, nothing written)" if args.dry_run else ""))
+        for reason, count in result["skipped"].items():
+            print(f"  skipped {count} rows: {reason}")
+    finally:
+        backend.close()
+
+
+if __name__ == '__main__':
+    main()
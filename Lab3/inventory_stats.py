@@ -0,0 +1,222 @@
+import argparse
+from collections import Counter, defaultdict
+
+from pymongo import ReplaceOne, UpdateOne
+
+import connection
+
+# Materialized inventory statistics per brand and per category
+# One document per brand_id / category_id in "inventory_stats":
+#   {_id: "brand_id:3", dimension: "brand_id", key: 3,
+#    count, quantity, value (sum of price * quantity), price_sum, min_price, max_price}
+# ProductRepository keeps them up to date with $inc deltas on every product write and
+# cascade; average price is price_sum / count. min_price/max_price are recomputed for a
+# group (one aggregation over its products) only when its cheapest or most expensive
+# product leaves it. reconcile() rebuilds everything from the products and reports drift
+# (e.g. after mongoimport or concurrent updates of the same product).
+# Usage:
+#   python inventory_stats.py              (prints the statistics)
+#   python inventory_stats.py reconcile    (rebuilds them and prints the drift)
+
+STATS_COLLECTION = 'inventory_stats'
+DIMENSIONS = ('brand_id', 'category_id')
+
+# Product fields the statistics depend on
+STATS_PROJECTION = {"_id": 0, "product_id": 1, "price": 1, "quantity": 1, "brand_id": 1, "category_id": 1}
+STATS_FIELDS = {'price', 'quantity', 'brand_id', 'category_id'}
+
+SUM_FIELDS = ('count', 'quantity', 'value', 'price_sum')
+# Relative difference below which stored and actual sums are equal (float rounding)
+TOLERANCE = 1e-9
+
+
+def _stats_id(dimension, key):
+    return f"{dimension}:{key}"
+
+
+def _numbers(product):
+    price = product.get('price')
+    quantity = product.get('quantity') or 0
+    return price, quantity, (price or 0) * quantity
+
+
+def _group_stages(dimension, match=None):
+    return [
+        *([{"$match": match}] if match else []),
+        {"$group": {
+            "_id": f"${dimension}",
+            "count": {"$sum": 1},
+            "quantity": {"$sum": {"$ifNull": ["$quantity", 0]}},
+            "value": {"$sum": {"$multiply": [{"$ifNull": ["$price", 0]}, {"$ifNull": ["$quantity", 0]}]}},
+            "price_sum": {"$sum": {"$ifNull": ["$price", 0]}},
+            "min_price": {"$min": "$price"},
+            "max_price": {"$max": "$price"}
+        }}
+    ]
+
+
+def _differs(stored, actual):
+    if stored is None or actual is None:
+        return stored != actual
+    return abs(stored - actual) > TOLERANCE * max(1.0, abs(stored), abs(actual))
+
+
+class InventoryStats:
+    def __init__(self, db):
+        self.db = db
+        self.collection = db[STATS_COLLECTION]
+
+    @staticmethod
+    def affected_by(fields):
+        """
+        True if setting these product fields can change the statistics.
+        """
+        return not STATS_FIELDS.isdisjoint(fields)
+
+    def apply(self, removed=(), added=()):
+        """
+        Moves the statistics by the given product changes.
+
+        Args:
+            removed: Products (or their previous versions) that left their groups.
+            added: Products (or their new versions) that joined their groups.
+        """
+        deltas = defaultdict(lambda: {"inc": dict.fromkeys(SUM_FIELDS, 0), "min": None, "max": None,
+                                      "removed": Counter()})
+        for sign, products in ((-1, removed), (1, added)):
+            for product in products:
+                price, quantity, value = _numbers(product)
+                for dimension in DIMENSIONS:
+                    if product.get(dimension) is None:
+                        continue
+                    delta = deltas[(dimension, product[dimension])]
+                    for field, amount in zip(SUM_FIELDS, (1, quantity, value, price or 0)):
+                        delta["inc"][field] += sign * amount
+                    if price is None:
+                        continue
+                    if sign > 0:
+                        # A price that left and came back (e.g. a stock move) doesn't move the bounds
+                        if delta["removed"][price]:
+                            delta["removed"][price] -= 1
+                        delta["min"] = price if delta["min"] is None else min(delta["min"], price)
+                        delta["max"] = price if delta["max"] is None else max(delta["max"], price)
+                    else:
+                        delta["removed"][price] += 1
+        if not deltas:
+            return
+
+        requests = []
+        for (dimension, key), delta in deltas.items():
+            # Zero amounts are sent too, so a new group gets every sum field (quantity 0 products)
+            update = {
+                "$inc": delta["inc"],
+                "$setOnInsert": {"dimension": dimension, "key": key}
+            }
+            if delta["min"] is not None:
+                update["$min"] = {"min_price": delta["min"]}
+                update["$max"] = {"max_price": delta["max"]}
+            requests.append(UpdateOne({"_id": _stats_id(dimension, key)}, update, upsert=True))
+        self.collection.bulk_write(requests, ordered=False)
+
+        # Groups that lost their cheapest or most expensive product, or all products
+        touched = [_stats_id(dimension, key) for (dimension, key), delta in deltas.items()
+                   if delta["inc"]["count"] < 0 or +delta["removed"]]
+        if not touched:
+            return
+        stale = []
+        for stats in self.collection.find({"_id": {"$in": touched}}):
+            delta = deltas[(stats["dimension"], stats["key"])]
+            low, high = stats.get("min_price"), stats.get("max_price")
+            if stats.get("count", 0) <= 0:
+                self.collection.delete_one({"_id": stats["_id"], "count": {"$lte": 0}})
+            elif any(low is None or high is None or price <= low or price >= high for price in +delta["removed"]):
+                stale.append(stats)
+        for stats in stale:
+            self._refresh_bounds(stats["dimension"], stats["key"])
+
+    def _refresh_bounds(self, dimension, key):
+        # Served by the (brand_id, ...) / (category_id, ...) product indexes
+        result = list(self.db['products'].aggregate(_group_stages(dimension, {dimension: key})))
+        bounds = result[0] if result else {}
+        if bounds.get("min_price") is None:
+            # No priced product left. A stored null would sort below every price, so a later
+            # $min could never replace it
+            update = {"$unset": {"min_price": "", "max_price": ""}}
+        else:
+            update = {"$set": {"min_price": bounds["min_price"], "max_price": bounds["max_price"]}}
+        self.collection.update_one({"_id": _stats_id(dimension, key)}, update)
+
+    def by(self, dimension):
+        """
+        Statistics of all brands ("brand_id") or categories ("category_id") ordered by key,
+        each with "avg_price".
+        """
+        rows = list(self.collection.find({"dimension": dimension}).sort("key", 1))
+        for row in rows:
+            # Groups written before every sum field was initialised may lack some of them
+            for field in SUM_FIELDS:
+                row.setdefault(field, 0)
+            row.setdefault("min_price", None)
+            row.setdefault("max_price", None)
+            row["avg_price"] = row["price_sum"] / row["count"] if row.get("count") else None
+        return rows
+
+    def reconcile(self, fix=True):
+        """
+        Computes the statistics from the products and compares them with the stored ones.
+
+        Args:
+            fix: Replace the stored statistics with the computed ones.
+
+        Returns:
+            A list of (stats id, field, stored value, actual value) for every difference.
+        """
+        actual = {}
+        for dimension in DIMENSIONS:
+            for row in self.db['products'].aggregate(_group_stages(dimension), allowDiskUse=True):
+                if row["_id"] is None:
+                    continue
+                stats_id = _stats_id(dimension, row["_id"])
+                actual[stats_id] = {"_id": stats_id, "dimension": dimension, "key": row.pop("_id"),
+                                    # No bounds rather than null ones for a group without prices (see _refresh_bounds)
+                                    **{field: value for field, value in row.items() if value is not None}}
+        stored = {doc["_id"]: doc for doc in self.collection.find()}
+
+        drift = []
+        for stats_id in sorted(set(actual) | set(stored)):
+            expected, current = actual.get(stats_id, {}), stored.get(stats_id, {})
+            for field in (*SUM_FIELDS, "min_price", "max_price"):
+                if _differs(current.get(field), expected.get(field)):
+                    drift.append((stats_id, field, current.get(field), expected.get(field)))
+
+        if fix and drift:
+            requests = [ReplaceOne({"_id": stats_id}, doc, upsert=True) for stats_id, doc in actual.items()]
+            if requests:
+                self.collection.bulk_write(requests, ordered=False)
+            self.collection.delete_many({"_id": {"$nin": list(actual)}})
+        return drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inventory statistics per brand and category")
+    parser.add_argument('command', nargs='?', choices=['show', 'reconcile'], default='show')
+    parser.add_argument('--dry-run', action='store_true', help="reconcile: only report the drift")
+    args = parser.parse_args()
+
+    stats = InventoryStats(connection.get_db())
+    if args.command == 'reconcile':
+        drift = stats.reconcile(fix=not args.dry_run)
+        for stats_id, field, stored, actual in drift:
+            print(f"{stats_id} {field}: stored {stored}, actual {actual}")
+        print(f"{len(drift)} differences" + ("" if args.dry_run or not drift else ", fixed"))
+        return
+
+    for dimension in DIMENSIONS:
+        print(f"\nBy {dimension}:")
+        for row in stats.by(dimension):
+            print(f"{row['key']:>6}: {row['count']} products, {row['quantity']} units, value ${row['value']:.2f}, "
+                  f"price ${row['min_price']} - ${row['max_price']} (avg ${row['avg_price']:.2f})")
+
+
+if __name__ == '__main__':
+    main()
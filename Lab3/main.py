@@ -1,54 +1,66 @@
+import argparse
+import atexit
+
 import inquirer
-from pymongo import MongoClient
 
-# Establish connection to MongoDB
-client = MongoClient('mongodb://localhost:27017/')
-db = client['tv_store']
-products_collection = db['products']
-brands_collection = db['brands']
-categories_collection = db['category']
+import storage
+from profiling import CommandProfiler
+from repository import changed_fields
+from search import ProductSearch
+
+# Records every command per calling function when enabled (main.py --profile)
+command_profiler = CommandProfiler()
+
+# Storage: the tv_store MongoDB database, or the in-process engine with STORAGE_BACKEND=memory (see storage.py).
+# The MongoDB connection is opened on first use; URI, pool and timeouts come from MONGO_* variables (see connection.py)
+backend = storage.open_backend(listeners=[command_profiler])
+
+# Listing settings: rows shown per page and documents fetched per cursor round trip
+PAGE_SIZE = 20
+CURSOR_BATCH_SIZE = 100
+
+# Data access used by the menus (see repository.py)
+product_repository = backend.products
+brand_repository = backend.brands
+category_repository = backend.categories
+inventory_stats = backend.inventory_stats
+
+# Product search: 'text' (MongoDB text index), 'memory' (in-process index) or 'auto' (see search.py)
+SEARCH_MODE = 'auto' if backend.text_search else 'memory'
+product_search = ProductSearch(product_repository, mode=SEARCH_MODE)
 
 
 # Getters
-# Function to get brand options from MongoDB
+# Function to get brand options (cached, see ref_cache.py)
 def get_brands():
-    return list(brands_collection.find())
+    return brand_repository.all()
 
-# Function to get category options from MongoDB
+# Function to get category options (cached, see ref_cache.py)
 def get_categories():
-    return list(categories_collection.find())
-
-# Functions to get free id from collection
-def get_free_id_products():
-    existing_ids = sorted([product["product_id"] for product in products_collection.find({}, {"product_id": 1})])
-    free_id = 100
-    for existing_id in existing_ids:
-        if existing_id == free_id:
-            free_id += 1
-        else:
-            break
-    return free_id
-
-def get_free_id_brands():
-    existing_ids = sorted([brand["brand_id"] for brand in brands_collection.find({}, {"brand_id": 1})])
-    free_id = 0  # Start checking from ID 1
-    for existing_id in existing_ids:
-        if existing_id == free_id:
-            free_id += 1
-        else:
-            break
-    return free_id
-
-def get_free_id_categories():
-    existing_ids = sorted([category["category_id"] for category in categories_collection.find({}, {"category_id": 1})])
-    free_id = 0  # Start checking from ID 1
-    for existing_id in existing_ids:
-        if existing_id == free_id:
-            free_id += 1
-        else:
-            break
-    return free_id
+    return category_repository.all()
 
+# Walks pages with range queries on the id instead of skip, so every page costs the same.
+# fetch_page(after_id, limit) returns the rows of one page.
+def iter_pages(fetch_page, id_field, page_size=None):
+    page_size = page_size or PAGE_SIZE
+    last_id = None
+    while True:
+        page = list(fetch_page(last_id, page_size))
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1][id_field]
+
+# Prints pages one by one and asks before loading the next one
+def show_pages(pages, print_row):
+    for page in pages:
+        for row in page:
+            print_row(row)
+        if len(page) == PAGE_SIZE:
+            answer = inquirer.prompt([inquirer.Confirm('more', message="Show next page?", default=True)])
+            if not answer['more']:
+                break
 
 # ###################################################
 
@@ -79,12 +91,11 @@ def create_product():
     
     answers = inquirer.prompt(questions)
     
-    selected_category = next(item for item in categories if item['category_name'] == answers['category'])
-    selected_brand = next(item for item in brands if item['brand_name'] == answers['brand'])
+    selected_category = category_repository.by_name(answers['category'])
+    selected_brand = brand_repository.by_name(answers['brand'])
     
     # Create new product document
     new_product = {
-        "product_id": get_free_id_products(),
         "name": answers['name'],
         "price": float(answers['price']),
         "quantity": int(answers['quantity']),
@@ -95,23 +106,25 @@ def create_product():
     }
 
     # Insert new product into the products collection
-    products_collection.insert_one(new_product)
+    product_repository.create(new_product)
     print("Product successfully added!")
 
 # Display products by category or brand
 def display_products():
-    categories = list(categories_collection.find().sort({"category_id": 1}))
-    brands = list(brands_collection.find().sort({"brand_id": 1}))
-
     # Ask user whether to filter by category or brand
     filter_choice = inquirer.List(
         'filter_choice', 
         message="Filter products by", 
-        choices=["Category", "Brand", "All"]
+        choices=["Category", "Brand", "Price, size and quantity", "All"]
     )
     filter_answer = inquirer.prompt([filter_choice])
 
+    if filter_answer['filter_choice'] == "Price, size and quantity":
+        filter_products()
+        return
+
     if filter_answer['filter_choice'] == "Category":
+        categories = get_categories()
         category_choice = inquirer.List(
             'category', 
             message="Select category", 
@@ -120,10 +133,11 @@ def display_products():
         selected_category = inquirer.prompt([category_choice])
 
         # Find products by category_id
-        category = next(item for item in categories if item['category_name'] == selected_category['category'])
-        products = products_collection.find({'category_id': category['category_id']}).sort("product_id", 1)
+        category = category_repository.by_name(selected_category['category'])
+        query = {'category_id': category['category_id']}
 
     elif filter_answer['filter_choice'] == "Brand":
+        brands = get_brands()
         brand_choice = inquirer.List(
             'brand', 
             message="Select brand", 
@@ -132,34 +146,105 @@ def display_products():
         selected_brand = inquirer.prompt([brand_choice])
 
         # Find products by brand_id
-        brand = next(item for item in brands if item['brand_name'] == selected_brand['brand'])
-        products = products_collection.find({'brand_id': brand['brand_id']}).sort("product_id", 1)
+        brand = brand_repository.by_name(selected_brand['brand'])
+        query = {'brand_id': brand['brand_id']}
 
     else:  # No filter
-        products = products_collection.find().sort("product_id", 1)
+        query = {}
 
-    # Display products
+    # Display products page by page
     print("\nProducts:")
-    for product in products:
-        # Get category and brand names for display
-        category_name = next((cat['category_name'] for cat in categories if cat.get('category_id') == product.get('category_id')), "Unknown")
-        brand_name = next((brand['brand_name'] for brand in brands if brand.get('brand_id') == product.get('brand_id')), "Unknown")
-
-        print(f"\nID: {product['product_id']}\n"
-              f"Name: {product['name']}\n"
-              f"Price: ${product['price']}\n"
-              f"Quantity: {product['quantity']}\n"
-              f"Screen size: {product['diagonal']}\n"
-              f"Category: {category_name}\n"
-              f"Brand: {brand_name}\n"
-              f"Description: {product['description']}")
+    pages = iter_pages(lambda after_id, limit: product_repository.find_resolved(query, after_id, limit, CURSOR_BATCH_SIZE), 'product_id')
+    show_pages(pages, print_product)
+
+# Display products by price/diagonal/quantity ranges and brands/categories, with counts per brand and category
+def filter_products():
+    brands = get_brands()
+    categories = get_categories()
+    questions = [
+        inquirer.Text('price_min', message="Minimal price (empty - any)", default=''),
+        inquirer.Text('price_max', message="Maximal price (empty - any)", default=''),
+        inquirer.Text('diagonal_min', message="Minimal screen size (empty - any)", default=''),
+        inquirer.Text('diagonal_max', message="Maximal screen size (empty - any)", default=''),
+        inquirer.Text('quantity_min', message="Minimal quantity (empty - any)", default=''),
+        inquirer.Checkbox('brands', message="Brands (none selected - all)", choices=[brand['brand_name'] for brand in brands]),
+        inquirer.Checkbox('categories', message="Categories (none selected - all)", choices=[category['category_name'] for category in categories])
+    ]
+    answers = inquirer.prompt(questions)
+
+    def number(key):
+        return float(answers[key]) if answers[key].strip() else None
+
+    query = product_repository.build_filter(
+        price=(number('price_min'), number('price_max')),
+        diagonal=(number('diagonal_min'), number('diagonal_max')),
+        quantity=(number('quantity_min'), None),
+        brand_ids=[brand_repository.by_name(name)['brand_id'] for name in answers['brands']],
+        category_ids=[category_repository.by_name(name)['category_id'] for name in answers['categories']]
+    )
+
+    # First page and all counts in one round trip
+    result = product_repository.filter_with_facets(query, PAGE_SIZE)
+    print(f"\nFound {result['total']} products")
+    print("By brand: " + ", ".join(f"{(brand_repository.by_id(item['_id']) or {}).get('brand_name', 'Unknown')} ({item['count']})" for item in result['brands']))
+    print("By category: " + ", ".join(f"{(category_repository.by_id(item['_id']) or {}).get('category_name', 'Unknown')} ({item['count']})" for item in result['categories']))
+
+    # Following pages continue after the last shown product
+    first_page = result['products']
+    def fetch_page(after_id, limit):
+        if after_id is None:
+            return first_page
+        return product_repository.find_resolved(query, after_id, limit, CURSOR_BATCH_SIZE)
+
+    print("\nProducts:")
+    show_pages(iter_pages(fetch_page, 'product_id'), print_product)
+
+# Print one product row resolved by product_repository.find_resolved
+def print_product(product):
+    print(f"\nID: {product['product_id']}\n"
+          f"Name: {product['name']}\n"
+          f"Price: ${product['price']}\n"
+          f"Quantity: {product['quantity']}\n"
+          f"Screen size: {product['diagonal']}\n"
+          f"Category: {product['category_name']}\n"
+          f"Brand: {product['brand_name']}\n"
+          f"Description: {product['description']}")
 
 # Display all products in short variant
 def display_products_short():
-    products = products_collection.find({}, {'product_id': 1, 'name': 1, '_id': 0}).sort({"product_id": 1})
+    projection = {'product_id': 1, 'name': 1, '_id': 0}
     print("\nShort list of products")
-    for product in products:
-        print(f"ID: {product['product_id']} Name: {product['name']}")
+    pages = iter_pages(lambda after_id, limit: product_repository.find_page(None, projection, after_id, limit, CURSOR_BATCH_SIZE), 'product_id')
+    show_pages(pages, lambda product: print(f"ID: {product['product_id']} Name: {product['name']}"))
+
+# Search products by name and description
+def search_products():
+    answers = inquirer.prompt([inquirer.Text('text', message="Search for")])
+
+    page = 0
+    while True:
+        products = product_search.search(answers['text'], page, PAGE_SIZE)
+        if page == 0 and not products:
+            print("Nothing found!")
+            return
+        for product in products:
+            print(f"ID: {product['product_id']} Name: {product['name']} Price: ${product['price']}")
+        if len(products) < PAGE_SIZE:
+            return
+        answer = inquirer.prompt([inquirer.Confirm('more', message="Show next page?", default=True)])
+        if not answer['more']:
+            return
+        page += 1
+
+# Display units, stock value and prices per brand and per category (from inventory_stats, no product scan)
+def display_inventory_stats():
+    for title, dimension, repository, name_field in (("brand", "brand_id", brand_repository, "brand_name"),
+                                                     ("category", "category_id", category_repository, "category_name")):
+        print(f"\nBy {title}:")
+        for row in inventory_stats.by(dimension):
+            name = (repository.by_id(row['key']) or {}).get(name_field, 'Unknown')
+            print(f"{name}: {row['count']} products, {row['quantity']} units, stock value ${row['value']:.2f}, "
+                  f"price ${row['min_price']} - ${row['max_price']} (average ${row['avg_price']:.2f})")
 
 # Update product
 def update_product():
@@ -174,7 +259,7 @@ def update_product():
     brands = get_brands()
 
     product_id = int(answers['product_id'])
-    product = products_collection.find_one({"product_id": product_id})
+    product = product_repository.get(product_id)
 
     if product:
         questions = [
@@ -183,14 +268,14 @@ def update_product():
             inquirer.Text('quantity', message="Enter new product quantity", default=str(product['quantity'])),
             inquirer.Text('diagonal', message="Enter new screen size", default=str(product['diagonal'])),
             inquirer.Text('description', message="Enter new product description", default=product['description']),
-            inquirer.List('category', message="Select new category", choices=[category['category_name'] for category in categories], default=next(category['category_name'] for category in categories if category['category_id'] == product['category_id'])),
-            inquirer.List('brand', message="Select new brand", choices=[brand['brand_name'] for brand in brands], default=next(brand['brand_name'] for brand in brands if brand['brand_id'] == product['brand_id']))
+            inquirer.List('category', message="Select new category", choices=[category['category_name'] for category in categories], default=category_repository.by_id(product['category_id'])['category_name']),
+            inquirer.List('brand', message="Select new brand", choices=[brand['brand_name'] for brand in brands], default=brand_repository.by_id(product['brand_id'])['brand_name'])
         ]
         updated_data = inquirer.prompt(questions)
 
         # Map category and brand names back to their IDs
-        updated_category_id = next(category['category_id'] for category in categories if category['category_name'] == updated_data['category'])
-        updated_brand_id = next(brand['brand_id'] for brand in brands if brand['brand_name'] == updated_data['brand'])
+        updated_category_id = category_repository.by_name(updated_data['category'])['category_id']
+        updated_brand_id = brand_repository.by_name(updated_data['brand'])['brand_id']
 
         # Prepare the updated product data
         updated_product = {
@@ -199,19 +284,39 @@ def update_product():
             "quantity": int(updated_data['quantity']),
             "diagonal": float(updated_data['diagonal']),
             "description": updated_data['description'],
-            "category": updated_category_id,
-            "brand": updated_brand_id
+            "category_id": updated_category_id,
+            "brand_id": updated_brand_id
         }
 
+        # Send only the changed fields; drop the "category"/"brand" keys older versions wrote by mistake
+        changes = changed_fields(product, updated_product)
+        stale_keys = [key for key in ("category", "brand") if key in product]
+        if not changes and not stale_keys:
+            print("Nothing changed.")
+            return
+
         # Update the product in the database
-        products_collection.update_one(
-            {"product_id": product_id},
-            {"$set": updated_product}
-        )
+        product_repository.update_by_id(product_id, changes, unset=stale_keys)
         print("Product updated successfully!")
     else:
         print("Product not found!")
 
+# Add or take units of a product (atomic, the quantity never goes below zero)
+def adjust_stock():
+    display_products_short()
+
+    questions = [
+        inquirer.Text('product_id', message="Enter product ID:"),
+        inquirer.Text('delta', message="Units to add (negative to take)")
+    ]
+    answers = inquirer.prompt(questions)
+
+    quantity = product_repository.adjust_stock(int(answers['product_id']), int(answers['delta']))
+    if quantity is None:
+        print("Product not found or not enough units in stock!")
+    else:
+        print(f"Quantity is now {quantity}.")
+
 # Remove product by product_id
 def remove_product():
     display_products_short()
@@ -222,10 +327,8 @@ def remove_product():
     answers = inquirer.prompt(questions)
 
     product_id = int(answers['product_id'])
-    product = products_collection.find_one({"product_id": int(product_id)})
-    
-    if product:
-        products_collection.delete_one({"product_id": int(product_id)})
+
+    if product_repository.delete_by_id(product_id):
         print("Product removed successfully!")
     else:
         print("Product not found!")
@@ -244,27 +347,26 @@ def create_brand():
     ]
     answers = inquirer.prompt(questions)
     brand = {
-        "brand_id": get_free_id_brands(),
         "brand_name": answers['brand_name'],
         "brand_description": answers['brand_description'],
         "headquarters": answers['headquarters'],
         "founded_year": int(answers['founded_year']),
         "website": answers['website']
     }
-    brands_collection.insert_one(brand)
+    brand_repository.create(brand)
     print("Brand created successfully!")
 
 # Display all brands
 def display_brands():
-    brands = brands_collection.find().sort({"brand_id": 1})
-    for brand in brands:
-        print(f"\nID: {brand['brand_id']}\nName: {brand['brand_name']}\nDescription: {brand['brand_description']}\nLocation: {brand['headquarters']}\nEstablished: {brand['founded_year']}\nWebsite: {brand['website']}")
+    projection = {"_id": 0, "brand_id": 1, "brand_name": 1, "brand_description": 1, "headquarters": 1, "founded_year": 1, "website": 1}
+    pages = iter_pages(lambda after_id, limit: brand_repository.find_page(None, projection, after_id, limit, CURSOR_BATCH_SIZE), 'brand_id')
+    show_pages(pages, lambda brand: print(f"\nID: {brand['brand_id']}\nName: {brand['brand_name']}\nDescription: {brand['brand_description']}\nLocation: {brand['headquarters']}\nEstablished: {brand['founded_year']}\nWebsite: {brand['website']}"))
 
 def display_brands_short():
-    brands = brands_collection.find({}, {"brand_name": 1, "brand_id": 1}).sort({"brand_id": 1})
+    projection = {"brand_name": 1, "brand_id": 1, "_id": 0}
     print("\nBrands:")
-    for brand in brands:
-        print(f"ID: {brand['brand_id']} Name: {brand['brand_name']}")
+    pages = iter_pages(lambda after_id, limit: brand_repository.find_page(None, projection, after_id, limit, CURSOR_BATCH_SIZE), 'brand_id')
+    show_pages(pages, lambda brand: print(f"ID: {brand['brand_id']} Name: {brand['brand_name']}"))
 
 # Update brand
 def update_brand():
@@ -276,7 +378,7 @@ def update_brand():
     answers = inquirer.prompt(questions_start)
 
     brand_id = int(answers['brand_id'])
-    brand = brands_collection.find_one({"brand_id": brand_id})
+    brand = brand_repository.get(brand_id)
 
     if brand:
         questions = [
@@ -297,7 +399,7 @@ def update_brand():
             "website": answers['website']
         }
 
-        brands_collection.update_one({"brand_id": brand_id}, {"$set": updated_brand})
+        brand_repository.update_by_id(brand_id, updated_brand)
         print("Brand updated successfully!")
     else:
         print("Brand not found!")
@@ -313,12 +415,11 @@ def remove_brand():
     answers = inquirer.prompt(questions)
 
     brand_id = int(answers['brand_id'])
-    brand = brands_collection.find_one({"brand_id": brand_id})
 
-    if brand:
-        products_collection.delete_many({"brand_id": brand_id})
-        brands_collection.delete_one({"brand_id": brand_id})
-        print("Brand and all relevant products removed successfully!")
+    # Products are removed in chunks, an interrupted removal is finished on next start
+    removed = brand_repository.delete_by_id(brand_id)
+    if removed is not None:
+        print(f"Brand and all relevant products ({removed}) removed successfully!")
     else:
         print("Brand not found!")
 
@@ -335,26 +436,25 @@ def create_category():
     ]
     answers = inquirer.prompt(questions)
     category = {
-        "category_id": get_free_id_categories(),
         "category_name": answers['category_name'],
         "category_description": answers['category_description'],
         'category_type': answers['category_type'],
         'target_audience': answers['target_audience']
     }
-    categories_collection.insert_one(category)
+    category_repository.create(category)
     print("Category created successfully!")
 
 # Display all categories
 def display_categories():
-    categories = categories_collection.find().sort({"category_id": 1})
-    for category in categories:
-        print(f"\nID: {category['category_id']}\nName: {category['category_name']}\nDescription: {category['category_description']}\nType: {category['category_type']}\nTarget audience: {category['target_audience']}")
+    projection = {"_id": 0, "category_id": 1, "category_name": 1, "category_description": 1, "category_type": 1, "target_audience": 1}
+    pages = iter_pages(lambda after_id, limit: category_repository.find_page(None, projection, after_id, limit, CURSOR_BATCH_SIZE), 'category_id')
+    show_pages(pages, lambda category: print(f"\nID: {category['category_id']}\nName: {category['category_name']}\nDescription: {category['category_description']}\nType: {category['category_type']}\nTarget audience: {category['target_audience']}"))
 
 def display_categories_short():
-    categories = categories_collection.find({}, {"category_name": 1, "category_id": 1, "_id": 0}).sort({"category_id": 1})
+    projection = {"category_name": 1, "category_id": 1, "_id": 0}
     print("\nCategories:")
-    for category in categories:
-        print(f"ID: {category['category_id']} Name: {category['category_name']}")
+    pages = iter_pages(lambda after_id, limit: category_repository.find_page(None, projection, after_id, limit, CURSOR_BATCH_SIZE), 'category_id')
+    show_pages(pages, lambda category: print(f"ID: {category['category_id']} Name: {category['category_name']}"))
 
 # Update category
 def update_category():
@@ -366,7 +466,7 @@ def update_category():
     answers = inquirer.prompt(questions_start)
 
     category_id = int(answers['category_id'])
-    category = categories_collection.find_one({"category_id": category_id})
+    category = category_repository.get(category_id)
 
     if category:
         questions = [
@@ -385,7 +485,7 @@ def update_category():
             "target_audience": answers['target_audience']
         }
 
-        categories_collection.update_one({"category_id": category_id}, {"$set": updated_category})
+        category_repository.update_by_id(category_id, updated_category)
         print("Category updated successfully!")
     else:
         print("Category not found!")
@@ -400,12 +500,11 @@ def remove_category():
     answers = inquirer.prompt(questions)
 
     category_id = int(answers['category_id'])
-    category = categories_collection.find_one({"category_id": category_id})
 
-    if category:
-        products_collection.delete_many({"category_id": category_id})
-        categories_collection.delete_one({"category_id": category_id})
-        print("Category and all relevant products removed successfully!")
+    # Products are removed in chunks, an interrupted removal is finished on next start
+    removed = category_repository.delete_by_id(category_id)
+    if removed is not None:
+        print(f"Category and all relevant products ({removed}) removed successfully!")
     else:
         print("Category not found!")
 
@@ -414,7 +513,7 @@ def remove_category():
 # Sections menu
 def product_menu():
     questions_product = [
-            inquirer.List('action', message="Select an action", choices=["Create Product", "Display Products", "Update Product", "Remove Product", "Exit"])
+            inquirer.List('action', message="Select an action", choices=["Create Product", "Display Products", "Search Products", "Inventory Statistics", "Update Product", "Adjust Stock", "Remove Product", "Exit"])
         ]
         
     answers = inquirer.prompt(questions_product)
@@ -424,8 +523,14 @@ def product_menu():
         create_product()
     elif action == "Display Products":
         display_products()
+    elif action == "Search Products":
+        search_products()
+    elif action == "Inventory Statistics":
+        display_inventory_stats()
     elif action == "Update Product":
         update_product()
+    elif action == "Adjust Stock":
+        adjust_stock()
     elif action == "Remove Product":
         remove_product()
     elif action == "Exit":
@@ -474,8 +579,25 @@ def category_menu():
 
 # ###################################################
 
+# Prints what the profiler recorded, with plans of slow commands
+def print_profile():
+    print("\nMongoDB commands by function:")
+    print(command_profiler.summary(backend.client))
+    for name, repository in (("Brands", brand_repository), ("Categories", category_repository)):
+        if repository.cache is not None:
+            stats = repository.cache.stats()
+            print(f"{name} cache: {stats['hits']} hits, {stats['misses']} misses")
+
 # Main menu
-def main_menu():
+def main_menu(profile=False):
+    if profile:
+        command_profiler.enabled = True
+        atexit.register(print_profile)
+
+    # Indexes and query plans, interrupted cascades (MongoDB); the memory engine is loaded already
+    backend.startup()
+    atexit.register(backend.close)
+
     questions_main = [
         inquirer.List('main', message="Select an section", choices=["Product", "Category", "Brand", "Exit"])
     ]
@@ -496,4 +618,7 @@ def main_menu():
 
         
 if __name__ == '__main__':
-    main_menu()
+    parser = argparse.ArgumentParser(description="TV store catalog")
+    parser.add_argument('--profile', action='store_true', help="Print MongoDB command statistics at exit")
+    args = parser.parse_args()
+    main_menu(profile=args.profile)
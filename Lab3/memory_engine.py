@@ -0,0 +1,697 @@
+import bisect
+import heapq
+import json
+import operator
+import os
+import threading
+from collections import Counter
+
+from id_allocator import RECYCLE_IDS
+from inventory_stats import DIMENSIONS, STATS_FIELDS
+from repository import ProductRepository
+
+# In-process storage engine for the 'memory' backend (see storage.py)
+# Every table keeps its documents in a dict by id (hash index) plus:
+#   - a sorted list of ids, for keyset pagination in id order
+#   - hash indexes on unique fields (brand_name, category_name)
+#   - sorted (value, id) indexes on secondary fields (brand_id, category_id, price)
+# A query is answered from the index with the fewest candidates (counted with bisect),
+# or by walking the ids in order when no index applies.
+# With a data directory every write is appended to log.jsonl; on open snapshot.json is
+# loaded and the log replayed. compact() writes a new snapshot and empties the log, it
+# runs by itself every COMPACT_AFTER logged writes.
+# Queries support equality, $in, $gt, $gte, $lt and $lte (what repository.py builds).
+
+COMPACT_AFTER = 10000
+# fsync the log after every write (safer, much slower)
+SYNC_WRITES = False
+
+SNAPSHOT_FILE = 'snapshot.json'
+LOG_FILE = 'log.jsonl'
+
+RANGE_OPERATORS = {'$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le}
+
+# table -> (id field, unique fields, sorted fields)
+TABLES = {
+    'products': ('product_id', (), ('brand_id', 'category_id', 'price')),
+    'brands': ('brand_id', ('brand_name',), ()),
+    'category': ('category_id', ('category_name',), ()),
+}
+
+
+def _matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            for op, argument in condition.items():
+                if op == '$in':
+                    if value not in argument:
+                        return False
+                elif op in RANGE_OPERATORS:
+                    if value is None or not RANGE_OPERATORS[op](value, argument):
+                        return False
+                else:
+                    raise ValueError(f"Unsupported query operator: {op}")
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return dict(doc)
+    included = [field for field, flag in projection.items() if flag and field != '_id']
+    if included:
+        return {field: doc[field] for field in included if field in doc}
+    return {field: value for field, value in doc.items() if field not in projection}
+
+
+def _indexable(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+
+class SortedIndex:
+    """
+    (value, id) pairs in order; documents without a numeric value are not indexed.
+    """
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, value, doc_id):
+        if _indexable(value):
+            bisect.insort(self.keys, (value, doc_id))
+
+    def remove(self, value, doc_id):
+        if _indexable(value):
+            position = bisect.bisect_left(self.keys, (value, doc_id))
+            if position < len(self.keys) and self.keys[position] == (value, doc_id):
+                del self.keys[position]
+
+    def ranges(self, condition):
+        """
+        Position ranges of the keys matching a condition, or None if the index can't serve it.
+        """
+        if not isinstance(condition, dict):
+            condition = {'$in': [condition]}
+        if '$in' in condition:
+            values = condition['$in']
+            if not all(_indexable(value) for value in values):
+                return None
+            return [(bisect.bisect_left(self.keys, (value, float('-inf'))),
+                     bisect.bisect_right(self.keys, (value, float('inf')))) for value in set(values)]
+        low, high = 0, len(self.keys)
+        for op, argument in condition.items():
+            if op not in RANGE_OPERATORS or not _indexable(argument):
+                return None
+            if op == '$gt':
+                low = max(low, bisect.bisect_right(self.keys, (argument, float('inf'))))
+            elif op == '$gte':
+                low = max(low, bisect.bisect_left(self.keys, (argument, float('-inf'))))
+            elif op == '$lt':
+                high = min(high, bisect.bisect_left(self.keys, (argument, float('-inf'))))
+            else:
+                high = min(high, bisect.bisect_right(self.keys, (argument, float('inf'))))
+        return [(low, max(low, high))]
+
+
+class Table:
+    def __init__(self, engine, name, id_field, unique_fields=(), sorted_fields=()):
+        self.engine = engine
+        self.name = name
+        self.id_field = id_field
+        self.docs = {}
+        self.ids = []
+        self.unique = {field: {} for field in unique_fields}
+        self.sorted = {field: SortedIndex() for field in sorted_fields}
+        self.seq = None
+        self.free_ids = []
+
+    # Index maintenance
+    def _index(self, doc):
+        doc_id = doc[self.id_field]
+        for field, index in self.unique.items():
+            if doc.get(field) is not None:
+                index[doc[field]] = doc_id
+        for field, index in self.sorted.items():
+            index.add(doc.get(field), doc_id)
+
+    def _unindex(self, doc):
+        doc_id = doc[self.id_field]
+        for field, index in self.unique.items():
+            if index.get(doc.get(field)) == doc_id:
+                del index[doc[field]]
+        for field, index in self.sorted.items():
+            index.remove(doc.get(field), doc_id)
+
+    def _put(self, doc):
+        doc_id = doc[self.id_field]
+        previous = self.docs.get(doc_id)
+        self.docs[doc_id] = doc
+        if previous is None:
+            bisect.insort(self.ids, doc_id)
+            self._index(doc)
+            return
+        # Only indexes whose field changed are touched
+        for field, index in self.unique.items():
+            if previous.get(field) != doc.get(field):
+                if index.get(previous.get(field)) == doc_id:
+                    del index[previous[field]]
+                if doc.get(field) is not None:
+                    index[doc[field]] = doc_id
+        for field, index in self.sorted.items():
+            if previous.get(field) != doc.get(field):
+                index.remove(previous.get(field), doc_id)
+                index.add(doc.get(field), doc_id)
+
+    def _delete(self, doc_id):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return None
+        self._unindex(doc)
+        del self.ids[bisect.bisect_left(self.ids, doc_id)]
+        return doc
+
+    # Reads
+    def get(self, doc_id, projection=None):
+        doc = self.docs.get(doc_id)
+        return None if doc is None else _project(doc, projection)
+
+    def get_by(self, field, value):
+        doc_id = self.unique[field].get(value)
+        return None if doc_id is None else dict(self.docs[doc_id])
+
+    def _candidates(self, query, after_id):
+        # Ids after after_id in id order from the most selective sorted index,
+        # or None if no index serves the query
+        best = None
+        for field, index in self.sorted.items():
+            if field not in query:
+                continue
+            ranges = index.ranges(query[field])
+            if ranges is None:
+                continue
+            size = sum(high - low for low, high in ranges)
+            if best is None or size < best[0]:
+                best = (size, index, ranges)
+        if best is None:
+            return None
+        _, index, ranges = best
+        keys = index.keys
+        if len(ranges) == 1 and ranges[0][0] < ranges[0][1] and keys[ranges[0][0]][0] == keys[ranges[0][1] - 1][0]:
+            # One value: its (value, id) keys are in id order already
+            low, high = ranges[0]
+            if after_id is not None:
+                low = bisect.bisect_right(keys, (keys[low][0], after_id), low, high)
+            return (keys[position][1] for position in range(low, high))
+        ids = sorted(keys[position][1] for low, high in ranges for position in range(low, high))
+        return self._after(ids, after_id)
+
+    @staticmethod
+    def _after(ids, after_id):
+        start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+        return (ids[position] for position in range(start, len(ids)))
+
+    def _scan(self, query, after_id=None):
+        # Matching documents (not copies) in id order; consume under the engine lock
+        query = dict(query or {})
+        id_condition = query.pop(self.id_field, None)
+        ids = None
+        if id_condition is not None:
+            if not isinstance(id_condition, dict):
+                id_condition = {'$in': [id_condition]}
+            if '$in' in id_condition:
+                # An id equality or $in goes straight to the hash index
+                ids = self._after(sorted(doc_id for doc_id in set(id_condition['$in']) if doc_id in self.docs), after_id)
+                id_condition = {op: argument for op, argument in id_condition.items() if op != '$in'}
+            if id_condition:
+                query[self.id_field] = id_condition
+        if ids is None:
+            ids = self._candidates(query, after_id)
+        if ids is None:
+            ids = self._after(self.ids, after_id)
+        for doc_id in ids:
+            doc = self.docs.get(doc_id)
+            if doc is not None and _matches(doc, query):
+                yield doc
+
+    def find(self, query=None, projection=None, after_id=None, limit=0):
+        """
+        Matching documents in id order after after_id; limit 0 - all.
+        """
+        with self.engine.lock:
+            results = []
+            for doc in self._scan(query, after_id):
+                results.append(_project(doc, projection))
+                if limit and len(results) >= limit:
+                    break
+            return results
+
+    # Writes (logged)
+    def insert(self, doc):
+        doc = dict(doc)
+        doc.pop('_id', None)
+        with self.engine.lock:
+            if doc[self.id_field] in self.docs:
+                raise KeyError(f"Duplicate {self.id_field}: {doc[self.id_field]}")
+            self._put(doc)
+            self.engine.log({"op": "put", "table": self.name, "doc": doc})
+        return doc
+
+    def update(self, doc_id, fields, unset=()):
+        """
+        Returns:
+            The previous version of the document, or None if it does not exist.
+        """
+        with self.engine.lock:
+            previous = self.docs.get(doc_id)
+            if previous is None:
+                return None
+            doc = {**previous, **fields}
+            for field in unset:
+                doc.pop(field, None)
+            self._put(doc)
+            self.engine.log({"op": "put", "table": self.name, "doc": doc})
+            return dict(previous)
+
+    def delete(self, doc_id):
+        """
+        Returns:
+            The removed document, or None if it did not exist.
+        """
+        with self.engine.lock:
+            doc = self._delete(doc_id)
+            if doc is not None:
+                self.engine.log({"op": "delete", "table": self.name, "id": doc_id})
+                if RECYCLE_IDS:
+                    heapq.heappush(self.free_ids, doc_id)
+            return doc
+
+    def next_id(self, start=0):
+        """
+        A free id: the smallest released one, else one after the largest ever used.
+        """
+        with self.engine.lock:
+            while self.free_ids:
+                doc_id = heapq.heappop(self.free_ids)
+                if doc_id not in self.docs:
+                    return doc_id
+            if self.seq is None:
+                self.seq = self.ids[-1] + 1 if self.ids else start
+            self.seq = max(self.seq, start, self.ids[-1] + 1 if self.ids else start)
+            doc_id = self.seq
+            self.seq += 1
+            return doc_id
+
+
+class Engine:
+    def __init__(self, path=None, tables=None):
+        """
+        Args:
+            path: Data directory for the snapshot and the log; None keeps everything in memory.
+            tables: table name -> (id field, unique fields, sorted fields), TABLES by default.
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self.tables = {name: Table(self, name, *spec) for name, spec in (tables or TABLES).items()}
+        self._log_file = None
+        self._logged = 0
+        # True if there was no data directory content yet (or no directory at all)
+        self.created = not path or not any(os.path.exists(os.path.join(path, name))
+                                            for name in (SNAPSHOT_FILE, LOG_FILE))
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+            self._log_file = open(os.path.join(path, LOG_FILE), 'a', encoding='utf-8')
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def _apply(self, entry):
+        table = self.tables[entry["table"]]
+        if entry["op"] == "put":
+            table._put(entry["doc"])
+        else:
+            table._delete(entry["id"])
+
+    def _load(self):
+        snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding='utf-8') as f:
+                for name, docs in json.load(f).items():
+                    for doc in docs:
+                        self.tables[name]._put(doc)
+        log_path = os.path.join(self.path, LOG_FILE)
+        if os.path.exists(log_path):
+            # Byte offset after the last complete entry
+            end = 0
+            with open(log_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # Torn last write
+                    self._apply(json.loads(line))
+                    self._logged += 1
+                    end += len(line)
+                torn = f.seek(0, os.SEEK_END) > end
+            if torn:
+                # Cut the torn write off, otherwise the next entry would be appended to it
+                with open(log_path, 'r+b') as f:
+                    f.truncate(end)
+
+    def log(self, entry):
+        if self._log_file is None:
+            return
+        self._log_file.write(json.dumps(entry, default=str) + '\n')
+        self._log_file.flush()
+        if SYNC_WRITES:
+            os.fsync(self._log_file.fileno())
+        self._logged += 1
+        if self._logged >= COMPACT_AFTER:
+            self.compact()
+
+    def compact(self):
+        """
+        Writes all tables to a new snapshot and empties the log.
+        """
+        if not self.path:
+            return
+        with self.lock:
+            snapshot_path = os.path.join(self.path, SNAPSHOT_FILE)
+            tmp_path = snapshot_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({name: [table.docs[doc_id] for doc_id in table.ids]
+                           for name, table in self.tables.items()}, f, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, snapshot_path)
+            # The snapshot has everything the log had
+            self._log_file.close()
+            self._log_file = open(os.path.join(self.path, LOG_FILE), 'w', encoding='utf-8')
+            self._logged = 0
+
+    def close(self):
+        if self._log_file is not None:
+            self.compact()
+            self._log_file.close()
+            self._log_file = None
+
+
+class MemoryRepository:
+    """
+    Same interface as repository.Repository, on an engine table.
+    """
+
+    def __init__(self, engine, collection_name, id_field, start_id=0):
+        self.engine = engine
+        self.collection_name = collection_name
+        self.table = engine[collection_name]
+        self.id_field = id_field
+        self.start_id = start_id
+        # Callables (repository, created_docs, updated_ids, deleted_ids) run after every write
+        self.listeners = []
+
+    # Reads
+    def get(self, doc_id, projection=None):
+        return self.table.get(doc_id, projection)
+
+    def find_by_ids(self, ids, projection=None):
+        return self.table.find({self.id_field: {"$in": list(ids)}}, projection)
+
+    def find_page(self, query=None, projection=None, after_id=None, limit=20, batch_size=100):
+        return self.table.find(query, projection, after_id, limit)
+
+    # IDs
+    def next_id(self):
+        return self.table.next_id(self.start_id)
+
+    # Writes
+    def create(self, doc):
+        if doc.get(self.id_field) is None:
+            doc[self.id_field] = self.next_id()
+        self.table.insert(doc)
+        self._changed(created=[doc])
+        return doc[self.id_field]
+
+    def create_many(self, docs):
+        docs = list(docs)
+        with self.engine.lock:
+            for doc in docs:
+                if doc.get(self.id_field) is None:
+                    doc[self.id_field] = self.next_id()
+                self.table.insert(doc)
+        if docs:
+            self._changed(created=docs)
+        return [doc[self.id_field] for doc in docs]
+
+    def update_by_id(self, doc_id, fields, unset=()):
+        previous = self.table.update(doc_id, fields, unset)
+        if previous is None:
+            return False
+        self._updated([previous], [{**previous, **fields}])
+        self._changed(updated_ids=[doc_id])
+        return True
+
+    def update_many_by_id(self, updates):
+        items = list(updates.items() if isinstance(updates, dict) else updates)
+        previous, current = [], []
+        with self.engine.lock:
+            for doc_id, fields in items:
+                old = self.table.update(doc_id, fields)
+                if old is not None:
+                    previous.append(old)
+                    current.append({**old, **fields})
+        self._updated(previous, current)
+        if items:
+            self._changed(updated_ids=[doc_id for doc_id, _ in items])
+        return len(previous)
+
+    def delete_by_id(self, doc_id):
+        removed = self.table.delete(doc_id)
+        if removed is None:
+            return False
+        self._updated([removed], [])
+        self._changed(deleted_ids=[doc_id])
+        return True
+
+    def delete_many_by_id(self, ids):
+        ids = list(ids)
+        with self.engine.lock:
+            removed = [doc for doc in map(self.table.delete, ids) if doc is not None]
+        self._updated(removed, [])
+        if ids:
+            self._changed(deleted_ids=ids)
+        return len(removed)
+
+    def _updated(self, previous, current):
+        pass
+
+    def _changed(self, created=(), updated_ids=(), deleted_ids=()):
+        for listener in self.listeners:
+            listener(self, created, updated_ids, deleted_ids)
+
+
+class MemoryInventoryStats:
+    """
+    Inventory statistics per brand and category, maintained in memory on every product write.
+    """
+
+    def __init__(self, products_table):
+        self.table = products_table
+        self.groups = {}
+        self.reconcile()
+
+    def _group(self, dimension, key):
+        return self.groups.setdefault((dimension, key), {
+            "dimension": dimension, "key": key, "count": 0, "quantity": 0, "value": 0, "price_sum": 0,
+            "prices": []  # sorted, for min/max
+        })
+
+    def apply(self, removed=(), added=()):
+        for sign, products in ((-1, removed), (1, added)):
+            for product in products:
+                price = product.get('price')
+                quantity = product.get('quantity') or 0
+                for dimension in DIMENSIONS:
+                    if product.get(dimension) is None:
+                        continue
+                    group = self._group(dimension, product[dimension])
+                    group["count"] += sign
+                    group["quantity"] += sign * quantity
+                    group["value"] += sign * (price or 0) * quantity
+                    group["price_sum"] += sign * (price or 0)
+                    if price is not None:
+                        prices = group["prices"]
+                        if sign > 0:
+                            bisect.insort(prices, price)
+                        else:
+                            position = bisect.bisect_left(prices, price)
+                            if position < len(prices) and prices[position] == price:
+                                del prices[position]
+                    if group["count"] <= 0:
+                        del self.groups[(dimension, product[dimension])]
+
+    @staticmethod
+    def affected_by(fields):
+        return not STATS_FIELDS.isdisjoint(fields)
+
+    def by(self, dimension):
+        rows = []
+        for (group_dimension, key), group in sorted(self.groups.items(), key=lambda item: item[0][1]):
+            if group_dimension != dimension:
+                continue
+            prices = group["prices"]
+            rows.append({
+                **{field: value for field, value in group.items() if field != "prices"},
+                "min_price": prices[0] if prices else None,
+                "max_price": prices[-1] if prices else None,
+                "avg_price": group["price_sum"] / group["count"] if group["count"] else None,
+            })
+        return rows
+
+    def reconcile(self, fix=True):
+        # Always exact in one process: rebuilding from the table can't find drift
+        with self.table.engine.lock:
+            self.groups = {}
+            self.apply(added=list(self.table.docs.values()))
+        return []
+
+
+class MemoryProductRepository(MemoryRepository):
+    build_filter = staticmethod(ProductRepository.build_filter)
+
+    def __init__(self, engine, stats=None):
+        super().__init__(engine, 'products', 'product_id', start_id=100)
+        self.stats = stats
+
+    def _resolve(self, product):
+        category = self.engine['category'].docs.get(product.get('category_id'))
+        brand = self.engine['brands'].docs.get(product.get('brand_id'))
+        return {
+            **{field: product.get(field) for field in ("product_id", "name", "price", "quantity", "diagonal",
+                                                       "description", "category_id", "brand_id")},
+            "category_name": (category or {}).get("category_name") or "Unknown",
+            "brand_name": (brand or {}).get("brand_name") or "Unknown",
+        }
+
+    def find_resolved(self, query=None, after_id=None, limit=None, batch_size=100):
+        return [self._resolve(product) for product in self.table.find(query, None, after_id, limit or 0)]
+
+    def filter_with_facets(self, query, limit=20):
+        brands, categories = Counter(), Counter()
+        products = []
+        with self.engine.lock:
+            for product in self.table._scan(query):
+                brands[product.get("brand_id")] += 1
+                categories[product.get("category_id")] += 1
+                if len(products) < limit:
+                    products.append(self._resolve(product))
+        return {
+            "products": products,
+            "brands": [{"_id": key, "count": count} for key, count in
+                       sorted(brands.items(), key=lambda item: (-item[1], item[0]))],
+            "categories": [{"_id": key, "count": count} for key, count in
+                           sorted(categories.items(), key=lambda item: (-item[1], item[0]))],
+            "total": sum(brands.values()),
+        }
+
+    def create(self, doc):
+        doc_id = super().create(doc)
+        if self.stats:
+            self.stats.apply(added=[doc])
+        return doc_id
+
+    def create_many(self, docs):
+        docs = list(docs)
+        ids = super().create_many(docs)
+        if self.stats:
+            self.stats.apply(added=docs)
+        return ids
+
+    def _updated(self, previous, current):
+        if self.stats:
+            self.stats.apply(removed=previous, added=current)
+
+    # Stock
+    def adjust_stock(self, product_id, delta):
+        with self.engine.lock:
+            product = self.table.docs.get(product_id)
+            if product is None or (product.get('quantity') or 0) + delta < 0:
+                return None
+            quantity = (product.get('quantity') or 0) + delta
+            previous = self.table.update(product_id, {"quantity": quantity})
+            self._updated([previous], [{**previous, "quantity": quantity}])
+        return quantity
+
+    def adjust_stock_many(self, deltas):
+        rejected = {}
+        with self.engine.lock:
+            for product_id, delta in deltas.items():
+                if delta and self.adjust_stock(product_id, delta) is None:
+                    rejected[product_id] = delta
+        return rejected
+
+    def removed_by_cascade(self, products):
+        self._updated(products, [])
+        self._changed(deleted_ids=[product["product_id"] for product in products])
+
+
+class MemoryReferenceRepository(MemoryRepository):
+    """
+    Brands and categories; lookups by id and name are hash lookups, so nothing is cached.
+    """
+
+    # Field of the products that references this table
+    PRODUCT_FIELDS = {'brands': 'brand_id', 'category': 'category_id'}
+
+    def __init__(self, engine, collection_name, id_field, name_field, products=None):
+        super().__init__(engine, collection_name, id_field)
+        self.name_field = name_field
+        self.products = products
+        self.cache = None
+
+    def all(self):
+        return self.table.find()
+
+    def by_id(self, doc_id):
+        return self.table.get(doc_id)
+
+    def by_name(self, name):
+        return self.table.get_by(self.name_field, name)
+
+    def delete_by_id(self, doc_id):
+        """
+        Removes the document and all products that reference it.
+
+        Returns:
+            Number of removed products, or None if the document does not exist.
+        """
+        products_table = self.engine['products']
+        with self.engine.lock:
+            if doc_id not in self.table.docs:
+                return None
+            removed = [products_table.delete(product["product_id"]) for product in
+                       products_table.find({self.PRODUCT_FIELDS[self.collection_name]: doc_id})]
+            self.table.delete(doc_id)
+        if self.products and removed:
+            self.products.removed_by_cascade(removed)
+        self._changed(deleted_ids=[doc_id])
+        return len(removed)
+
+    def delete_many_by_id(self, ids):
+        return sum(1 for doc_id in ids if self.delete_by_id(doc_id) is not None)
+
+
+def load_json_files(engine, files):
+    """
+    Loads JSON array files into empty tables (used to seed an offline store).
+
+    Args:
+        files: A list of (table name, path) pairs.
+    """
+    for name, path in files:
+        with open(path, encoding='utf-8') as f:
+            docs = json.load(f)
+        table = engine[name]
+        with engine.lock:
+            for doc in docs:
+                table.insert(doc)
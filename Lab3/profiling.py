@@ -0,0 +1,161 @@
+import bisect
+import os
+import sys
+import threading
+from collections import defaultdict
+
+from pymongo import monitoring
+
+# Per-operation latency instrumentation built on pymongo command monitoring
+# Every command is tagged with the app function that issued it (display_products,
+# create_brand, ...) and counted with a latency histogram and the number of
+# documents returned. Commands slower than SLOW_MS are kept and explained in the summary.
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+MENU_MODULE = os.path.join(APP_DIR, 'main.py')
+
+# Helpers that are never the interesting caller
+TAG_SKIP = {'iter_pages', 'show_pages', 'fetch_page', 'all', 'by_id', 'by_name', '_load'}
+
+# Upper bounds of the histogram buckets in milliseconds
+BUCKETS_MS = [0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, float('inf')]
+
+SLOW_MS = 100
+MAX_SLOW_COMMANDS = 20
+EXPLAINABLE = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+
+
+def _calling_function():
+    # Innermost main.py function on the stack (else the innermost app function),
+    # skipping lambdas, comprehensions and helpers
+    frame = sys._getframe(1)
+    innermost = None
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename.startswith(APP_DIR) and code.co_filename != __file__ \
+                and 'site-packages' not in code.co_filename \
+                and not code.co_name.startswith('<') and code.co_name not in TAG_SKIP:
+            if code.co_filename == MENU_MODULE:
+                return code.co_name
+            innermost = innermost or code.co_name
+        frame = frame.f_back
+    return innermost or 'unknown'
+
+
+def _returned_docs(reply):
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+    if 'value' in reply:  # findAndModify
+        return 1 if reply['value'] else 0
+    return reply.get('n', 0)
+
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.docs = 0
+        self.histogram = [0] * len(BUCKETS_MS)
+
+    def add(self, duration_ms, docs):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.docs += docs
+        self.histogram[bisect.bisect_left(BUCKETS_MS, duration_ms)] += 1
+
+    def percentile(self, p):
+        # Upper bound of the bucket that holds the p-th percentile
+        target = p / 100 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.histogram):
+            seen += count
+            if seen >= target and count:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+
+class CommandProfiler(monitoring.CommandListener):
+    """
+    Pass it to MongoClient(event_listeners=[...]); it records nothing until enabled.
+    """
+
+    def __init__(self, slow_ms=SLOW_MS):
+        self.enabled = False
+        self.slow_ms = slow_ms
+        self.stats = defaultdict(CommandStats)  # (function, command name) -> stats
+        self.slow_commands = []
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if not self.enabled:
+            return
+        command = None
+        if event.command_name in EXPLAINABLE:
+            command = {key: value for key, value in event.command.items()
+                       if not key.startswith('$') and key not in ('lsid', 'txnNumber', 'autocommit', 'startTransaction')}
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (_calling_function(), event.database_name, command)
+
+    def succeeded(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            if pending is None:
+                return
+            function, database_name, command = pending
+            duration_ms = event.duration_micros / 1000
+            self.stats[(function, event.command_name)].add(duration_ms, _returned_docs(event.reply))
+            if command is not None and duration_ms >= self.slow_ms and len(self.slow_commands) < MAX_SLOW_COMMANDS:
+                self.slow_commands.append({
+                    "function": function, "database": database_name, "command": command,
+                    "duration_ms": duration_ms, "plan": None
+                })
+
+    def failed(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+            if pending is not None:
+                self.stats[(pending[0], event.command_name)].failed += 1
+
+    def capture_explains(self, client):
+        """
+        Runs explain for the recorded slow commands (with recording switched off).
+        """
+        enabled, self.enabled = self.enabled, False
+        try:
+            for slow in self.slow_commands:
+                if slow["plan"] is not None:
+                    continue
+                try:
+                    explain = client[slow["database"]].command({"explain": slow["command"], "verbosity": "queryPlanner"})
+                    slow["plan"] = explain.get("queryPlanner", {}).get("winningPlan", explain)
+                except Exception as e:
+                    slow["plan"] = f"explain failed: {e}"
+        finally:
+            self.enabled = enabled
+
+    def summary(self, client=None):
+        """
+        Returns a printable report of all recorded commands, slowest functions first.
+        """
+        if client is not None:
+            self.capture_explains(client)
+
+        lines = [f"{'function':<28} {'command':<14} {'count':>7} {'total ms':>10} {'avg ms':>8} "
+                 f"{'p50':>7} {'p95':>7} {'p99':>7} {'docs':>8} {'failed':>6}"]
+        for (function, command_name), stats in sorted(self.stats.items(), key=lambda item: -item[1].total_ms):
+            average = stats.total_ms / stats.count if stats.count else 0
+            lines.append(f"{function:<28} {command_name:<14} {stats.count:>7} {stats.total_ms:>10.1f} {average:>8.2f} "
+                         f"{stats.percentile(50):>7.1f} {stats.percentile(95):>7.1f} {stats.percentile(99):>7.1f} "
+                         f"{stats.docs:>8} {stats.failed:>6}")
+
+        if self.slow_commands:
+            lines.append(f"\nCommands slower than {self.slow_ms} ms:")
+            for slow in self.slow_commands:
+                lines.append(f"  {slow['function']}: {slow['duration_ms']:.1f} ms {slow['command']}")
+                lines.append(f"    plan: {slow['plan']}")
+        return "\n".join(lines)
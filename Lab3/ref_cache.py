@@ -0,0 +1,123 @@
+import threading
+
+from pymongo import ReturnDocument
+
+# In-process cache for brand and category reference data.
+# Modes:
+#   'local'         - invalidated only by writes made through this process
+#   'version'       - every write bumps a version counter in the "counters" collection,
+#                     readers compare it (one _id lookup) and reload when it changed
+#   'change_stream' - a background thread watches the collection and invalidates on any
+#                     change (needs a replica set)
+
+VERSIONS_COLLECTION = 'counters'
+
+
+def bump_version(db, collection_name):
+    """
+    Increments the version counter of a collection (read by 'version' caches and api.py ETags).
+
+    Returns:
+        The new version.
+    """
+    counter = db[VERSIONS_COLLECTION].find_one_and_update(
+        {"_id": f"version:{collection_name}"},
+        {"$inc": {"v": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["v"]
+
+
+class ReferenceCache:
+    def __init__(self, db, collection_name, id_field, name_field, mode='local'):
+        if mode not in ('local', 'version', 'change_stream'):
+            raise ValueError(f"Unknown cache mode: {mode}")
+
+        self.db = db
+        self.collection_name = collection_name
+        self.id_field = id_field
+        self.name_field = name_field
+        self.mode = mode
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._docs = None
+        self._by_id = {}
+        self._by_name = {}
+        self._version = None
+        self._watcher = None
+
+        if mode == 'change_stream':
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+    @property
+    def _version_id(self):
+        return f"version:{self.collection_name}"
+
+    def _current_version(self):
+        counter = self.db[VERSIONS_COLLECTION].find_one({"_id": self._version_id}, {"v": 1})
+        return counter["v"] if counter else 0
+
+    def _watch(self):
+        with self.db[self.collection_name].watch() as stream:
+            for _ in stream:
+                self._clear()
+
+    def _clear(self):
+        with self._lock:
+            self._docs = None
+
+    def _load(self):
+        # Returns the cached documents, reloading them when they are missing or stale
+        version = self._current_version() if self.mode == 'version' else None
+
+        with self._lock:
+            if self._docs is not None and version == self._version:
+                self.hits += 1
+                return self._docs
+
+            self.misses += 1
+            docs = list(self.db[self.collection_name].find().sort(self.id_field, 1))
+            self._docs = docs
+            self._by_id = {doc[self.id_field]: doc for doc in docs}
+            self._by_name = {doc[self.name_field]: doc for doc in docs}
+            self._version = version
+            return docs
+
+    def all(self):
+        """
+        Returns all documents of the collection ordered by id.
+        """
+        return self._load()
+
+    def by_id(self, doc_id):
+        self._load()
+        return self._by_id.get(doc_id)
+
+    def by_name(self, name):
+        self._load()
+        return self._by_name.get(name)
+
+    def invalidate(self, version=None):
+        """
+        Drops the cached documents after a write. In 'version' mode other instances are told as well.
+
+        Args:
+            version: The version the writer already bumped the counter to, if it did.
+        """
+        if self.mode == 'version':
+            if version is None:
+                version = bump_version(self.db, self.collection_name)
+            with self._lock:
+                # Our own stale copy must not match the new version
+                self._docs = None
+                self._version = version
+            return
+        self._clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
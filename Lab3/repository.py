@@ -0,0 +1,471 @@
+from pymongo import DeleteMany, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from cascade import cascade_delete
+from id_allocator import allocate_id, release_ids, reserve_ids, sync_counter
+from inventory_stats import STATS_PROJECTION
+from ref_cache import ReferenceCache, bump_version
+
+# Data-access layer for products, brands and categories
+# No prompts here: the menus in main.py and scripts/jobs use the same calls.
+# Batch methods send one bulk_write per BATCH_SIZE documents.
+# read_preference routes the display reads (find_page, find_resolved, filter_with_facets),
+# bulk_write_concern applies to the batch writes only; single-document reads and writes
+# keep the client defaults so an edit always sees the primary.
+
+BATCH_SIZE = 1000
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def changed_fields(previous, fields):
+    """
+    The fields whose values differ from the previous version of the document.
+    """
+    return {key: value for key, value in fields.items() if key not in previous or previous[key] != value}
+
+
+def _update_spec(fields, unset=()):
+    update = {}
+    if fields:
+        update["$set"] = fields
+    if unset:
+        update["$unset"] = dict.fromkeys(unset, "")
+    return update
+
+
+class Repository:
+    def __init__(self, db, collection_name, id_field, start_id=0, read_preference=None, bulk_write_concern=None):
+        self.db = db
+        self.collection_name = collection_name
+        self.collection = db[collection_name]
+        self.id_field = id_field
+        self.start_id = start_id
+        self.read_collection = self.collection.with_options(read_preference=read_preference) \
+            if read_preference is not None else self.collection
+        self.bulk_collection = self.collection.with_options(write_concern=bulk_write_concern) \
+            if bulk_write_concern is not None else self.collection
+        # Callables (repository, created_docs, updated_ids, deleted_ids) run after every write
+        self.listeners = []
+
+    # Reads
+    def get(self, doc_id, projection=None):
+        return self.collection.find_one({self.id_field: doc_id}, projection)
+
+    def find_by_ids(self, ids, projection=None):
+        """
+        Documents with the given ids, in no particular order.
+        """
+        return self.collection.find({self.id_field: {"$in": list(ids)}}, projection)
+
+    def find_page(self, query=None, projection=None, after_id=None, limit=20, batch_size=100):
+        """
+        One page ordered by id, starting after after_id (keyset pagination).
+        """
+        page_query = dict(query or {})
+        if after_id is not None:
+            page_query[self.id_field] = {"$gt": after_id}
+        return self.read_collection.find(page_query, projection).sort(self.id_field, 1).limit(limit).batch_size(batch_size)
+
+    # IDs
+    def next_id(self):
+        return allocate_id(self.db, self.collection_name, self.collection, self.id_field, self.start_id)
+
+    def _assign_ids(self, docs):
+        # One counter round trip for all documents without an id
+        missing = [doc for doc in docs if doc.get(self.id_field) is None]
+        for doc, doc_id in zip(missing, reserve_ids(self.db, self.collection_name, self.collection,
+                                                    self.id_field, len(missing), self.start_id)):
+            doc[self.id_field] = doc_id
+
+    # Writes
+    def create(self, doc):
+        """
+        Inserts one document, allocating its id if it has none.
+
+        Returns:
+            The id of the new document.
+        """
+        allocated = doc.get(self.id_field) is None
+        if allocated:
+            doc[self.id_field] = self.next_id()
+        try:
+            self.collection.insert_one(doc)
+        except DuplicateKeyError:
+            if not allocated:
+                raise
+            # Documents were loaded past the counter (e.g. mongoimport): move it and retry once
+            sync_counter(self.db, self.collection_name, self.collection, self.id_field, self.start_id)
+            doc.pop("_id", None)
+            doc[self.id_field] = self.next_id()
+            self.collection.insert_one(doc)
+        self._changed(created=[doc])
+        return doc[self.id_field]
+
+    def create_many(self, docs):
+        """
+        Inserts many documents with unordered bulk writes.
+
+        Returns:
+            A list of ids of the inserted documents.
+        """
+        docs = list(docs)
+        self._assign_ids(docs)
+        for chunk in _chunks(docs, BATCH_SIZE):
+            self.bulk_collection.bulk_write([InsertOne(doc) for doc in chunk], ordered=False)
+        if docs:
+            self._changed(created=docs)
+        return [doc[self.id_field] for doc in docs]
+
+    def update_by_id(self, doc_id, fields, unset=()):
+        """
+        Sets the given fields of one document, only these are sent (see changed_fields()).
+
+        Args:
+            doc_id: Id of the document.
+            fields: A dict of fields to set.
+            unset: Names of fields to remove.
+
+        Returns:
+            True if the document exists.
+        """
+        if not fields and not unset:
+            return self.collection.count_documents({self.id_field: doc_id}, limit=1) == 1
+        result = self.collection.update_one({self.id_field: doc_id}, _update_spec(fields, unset))
+        if result.matched_count:
+            self._changed(updated_ids=[doc_id])
+        return result.matched_count == 1
+
+    def update_many_by_id(self, updates):
+        """
+        Sets fields of many documents.
+
+        Args:
+            updates: A dict id -> dict of fields to set, or a list of (id, fields) pairs.
+
+        Returns:
+            Number of documents that were found.
+        """
+        items = list(updates.items() if isinstance(updates, dict) else updates)
+        matched = 0
+        for chunk in _chunks(items, BATCH_SIZE):
+            requests = [UpdateOne({self.id_field: doc_id}, {"$set": fields}) for doc_id, fields in chunk]
+            result = self.bulk_collection.bulk_write(requests, ordered=False)
+            # Unacknowledged writes (w=0) report no counts
+            matched += result.matched_count if result.acknowledged else len(chunk)
+        if items:
+            self._changed(updated_ids=[doc_id for doc_id, _ in items])
+        return matched
+
+    def delete_by_id(self, doc_id):
+        """
+        Returns:
+            True if the document existed.
+        """
+        result = self.collection.delete_one({self.id_field: doc_id})
+        if result.deleted_count:
+            release_ids(self.db, self.collection_name, [doc_id])
+            self._changed(deleted_ids=[doc_id])
+        return result.deleted_count == 1
+
+    def delete_many_by_id(self, ids):
+        """
+        Returns:
+            Number of removed documents.
+        """
+        return len(self._delete_existing(ids, {"_id": 0, self.id_field: 1}))
+
+    def _delete_existing(self, ids, projection):
+        # Only ids that are found are deleted and released: an id given twice, or one that
+        # doesn't exist, must not end up on the free list
+        removed = []
+        for chunk in _chunks(list(dict.fromkeys(ids)), BATCH_SIZE):
+            docs = list(self.collection.find({self.id_field: {"$in": chunk}}, projection))
+            if docs:
+                existing = [doc[self.id_field] for doc in docs]
+                self.bulk_collection.bulk_write([DeleteMany({self.id_field: {"$in": existing}})], ordered=False)
+                removed.extend(docs)
+        if removed:
+            release_ids(self.db, self.collection_name, [doc[self.id_field] for doc in removed])
+            self._changed(deleted_ids=[doc[self.id_field] for doc in removed])
+        return removed
+
+    def _changed(self, created=(), updated_ids=(), deleted_ids=()):
+        # Bumps the collection version (ETags of api.py) and lets caches and indexes
+        # built from this collection follow the change
+        self._invalidate(bump_version(self.db, self.collection_name))
+        for listener in self.listeners:
+            listener(self, created, updated_ids, deleted_ids)
+
+    def _invalidate(self, version):
+        pass
+
+
+# Replaces category_id/brand_id with names via $lookup on the unique id indexes
+RESOLVE_NAMES_STAGES = [
+    {"$lookup": {"from": "category", "localField": "category_id", "foreignField": "category_id", "as": "category"}},
+    {"$lookup": {"from": "brands", "localField": "brand_id", "foreignField": "brand_id", "as": "brand"}},
+    {"$project": {
+        "_id": 0,
+        "product_id": 1, "name": 1, "price": 1, "quantity": 1, "diagonal": 1, "description": 1,
+        "category_id": 1, "brand_id": 1,
+        "category_name": {"$ifNull": [{"$arrayElemAt": ["$category.category_name", 0]}, "Unknown"]},
+        "brand_name": {"$ifNull": [{"$arrayElemAt": ["$brand.brand_name", 0]}, "Unknown"]}
+    }}
+]
+
+
+def resolved_pipeline(query=None, after_id=None, limit=None):
+    """
+    Products ordered by id after after_id, with category and brand names.
+    """
+    match = dict(query or {})
+    if after_id is not None:
+        match["product_id"] = {"$gt": after_id}
+    return [
+        {"$match": match},
+        {"$sort": {"product_id": 1}},
+        *([{"$limit": limit}] if limit else []),
+        *RESOLVE_NAMES_STAGES
+    ]
+
+
+def facets_pipeline(query, limit=20):
+    """
+    First products matching a filter plus match counts per brand and category (one $facet).
+    """
+    return [
+        {"$match": query},
+        {"$facet": {
+            "products": [{"$sort": {"product_id": 1}}, {"$limit": limit}, *RESOLVE_NAMES_STAGES],
+            "brands": [{"$group": {"_id": "$brand_id", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}],
+            "categories": [{"$group": {"_id": "$category_id", "count": {"$sum": 1}}}, {"$sort": {"count": -1, "_id": 1}}],
+            "total": [{"$count": "count"}]
+        }}
+    ]
+
+
+class ProductRepository(Repository):
+    """
+    Products; writes also move the inventory statistics if an InventoryStats is given.
+    """
+
+    def __init__(self, db, stats=None, **options):
+        super().__init__(db, 'products', 'product_id', start_id=100, **options)
+        self.stats = stats
+
+    def create(self, doc):
+        doc_id = super().create(doc)
+        if self.stats:
+            self.stats.apply(added=[doc])
+        return doc_id
+
+    def create_many(self, docs):
+        docs = list(docs)
+        ids = super().create_many(docs)
+        if self.stats:
+            self.stats.apply(added=docs)
+        return ids
+
+    def update_by_id(self, doc_id, fields, unset=()):
+        if not self.stats or not self.stats.affected_by(fields):
+            return super().update_by_id(doc_id, fields, unset)
+        # The previous version comes back with the update itself
+        previous = self.collection.find_one_and_update({"product_id": doc_id}, _update_spec(fields, unset),
+                                                       projection=STATS_PROJECTION)
+        if previous is None:
+            return False
+        self.stats.apply(removed=[previous], added=[{**previous, **fields}])
+        self._changed(updated_ids=[doc_id])
+        return True
+
+    def update_many_by_id(self, updates):
+        items = list(updates.items() if isinstance(updates, dict) else updates)
+        if not self.stats or not any(self.stats.affected_by(fields) for _, fields in items):
+            return super().update_many_by_id(items)
+        previous = {doc["product_id"]: doc for doc in
+                    self.collection.find({"product_id": {"$in": [doc_id for doc_id, _ in items]}}, STATS_PROJECTION)}
+        matched = super().update_many_by_id(items)
+        self.stats.apply(removed=list(previous.values()),
+                         added=[{**previous[doc_id], **fields} for doc_id, fields in items if doc_id in previous])
+        return matched
+
+    def delete_by_id(self, doc_id):
+        if not self.stats:
+            return super().delete_by_id(doc_id)
+        previous = self.collection.find_one_and_delete({"product_id": doc_id}, projection=STATS_PROJECTION)
+        if previous is None:
+            return False
+        release_ids(self.db, self.collection_name, [doc_id])
+        self.stats.apply(removed=[previous])
+        self._changed(deleted_ids=[doc_id])
+        return True
+
+    def delete_many_by_id(self, ids):
+        if not self.stats:
+            return super().delete_many_by_id(ids)
+        previous = self._delete_existing(ids, STATS_PROJECTION)
+        self.stats.apply(removed=previous)
+        return len(previous)
+
+    # Stock
+    def adjust_stock(self, product_id, delta):
+        """
+        Atomically changes the quantity of one product; it never goes below zero.
+
+        Returns:
+            The new quantity, or None if the product does not exist or has less than -delta in stock.
+        """
+        query = {"product_id": product_id}
+        if delta < 0:
+            query["quantity"] = {"$gte": -delta}
+        current = self.collection.find_one_and_update(query, {"$inc": {"quantity": delta}},
+                                                      projection=STATS_PROJECTION, return_document=ReturnDocument.AFTER)
+        if current is None:
+            return None
+        if self.stats:
+            self.stats.apply(removed=[{**current, "quantity": current["quantity"] - delta}], added=[current])
+        # Only the quantity changed: listeners (search) are not concerned, API ETags are
+        bump_version(self.db, self.collection_name)
+        return current["quantity"]
+
+    def adjust_stock_many(self, deltas):
+        """
+        Changes quantities of many products with unordered bulk writes, each guarded like adjust_stock().
+
+        Args:
+            deltas: A dict product_id -> quantity change.
+
+        Returns:
+            A dict product_id -> delta of the changes that were not applied
+            (missing product or not enough stock).
+        """
+        deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+        if not deltas:
+            return {}
+        # Prices for the statistics; quantities to tell which guarded writes were rejected
+        before = {doc["product_id"]: doc for doc in
+                  self.collection.find({"product_id": {"$in": list(deltas)}}, STATS_PROJECTION)}
+        requests = [UpdateOne({"product_id": product_id, **({"quantity": {"$gte": -delta}} if delta < 0 else {})},
+                              {"$inc": {"quantity": delta}})
+                    for product_id, delta in deltas.items() if product_id in before]
+        # Acknowledged writes whatever MONGO_BULK_WRITE_CONCERN is: rejected guards are told by the counts
+        matched = 0
+        for chunk in _chunks(requests, BATCH_SIZE):
+            matched += self.collection.bulk_write(chunk, ordered=False).matched_count
+
+        applied = [product_id for product_id in deltas if product_id in before]
+        if matched < len(applied):
+            # Some guards failed: an applied change moved the quantity by exactly its delta
+            # (exact as long as no other process changes the same products meanwhile)
+            after = {doc["product_id"]: doc.get("quantity") for doc in
+                     self.collection.find({"product_id": {"$in": applied}}, {"_id": 0, "product_id": 1, "quantity": 1})}
+            applied = [product_id for product_id in applied
+                       if after.get(product_id) == (before[product_id].get("quantity") or 0) + deltas[product_id]]
+
+        if applied:
+            if self.stats:
+                self.stats.apply(removed=[before[product_id] for product_id in applied],
+                                 added=[{**before[product_id], "quantity": (before[product_id].get("quantity") or 0)
+                                         + deltas[product_id]} for product_id in applied])
+            bump_version(self.db, self.collection_name)
+        applied = set(applied)
+        return {product_id: delta for product_id, delta in deltas.items() if product_id not in applied}
+
+    def removed_by_cascade(self, products):
+        """
+        Records products removed by a brand/category cascade (see cascade.py).
+        """
+        if self.stats:
+            self.stats.apply(removed=products)
+        self._changed(deleted_ids=[product["product_id"] for product in products])
+
+    def find_resolved(self, query=None, after_id=None, limit=None, batch_size=100):
+        """
+        Products with category and brand names resolved on the server in one round trip.
+
+        $lookup uses the unique brand_id/category_id indexes, rows are streamed from the cursor.
+        """
+        return self.read_collection.aggregate(resolved_pipeline(query, after_id, limit), batchSize=batch_size)
+
+    def filter_with_facets(self, query, limit=20):
+        """
+        First page of products matching a filter plus match counts per brand and category,
+        in a single $facet aggregation.
+
+        Args:
+            query: A filter, see build_filter().
+            limit: Number of products returned.
+
+        Returns:
+            A dict with "products" (resolved rows), "total", "brands" and "categories"
+            (lists of {"_id": brand_id/category_id, "count": n}, largest first).
+        """
+        result = next(self.read_collection.aggregate(facets_pipeline(query, limit)))
+        result["total"] = result["total"][0]["count"] if result["total"] else 0
+        return result
+
+    @staticmethod
+    def build_filter(price=None, diagonal=None, quantity=None, brand_ids=None, category_ids=None):
+        """
+        Builds a product filter. Ranges are (min, max) pairs, either end may be None.
+        """
+        query = {}
+        if brand_ids:
+            query["brand_id"] = {"$in": list(brand_ids)}
+        if category_ids:
+            query["category_id"] = {"$in": list(category_ids)}
+        for field, bounds in (("diagonal", diagonal), ("price", price), ("quantity", quantity)):
+            low, high = bounds or (None, None)
+            condition = {}
+            if low is not None:
+                condition["$gte"] = low
+            if high is not None:
+                condition["$lte"] = high
+            if condition:
+                query[field] = condition
+        return query
+
+
+class ReferenceRepository(Repository):
+    """
+    Brands and categories: cached reads, and deletes that remove dependent products.
+    """
+
+    def __init__(self, db, collection_name, id_field, name_field, cache_mode='local', products=None, **options):
+        super().__init__(db, collection_name, id_field, **options)
+        # Product repository that records the products removed by cascades
+        self.products = products
+        self.cache = ReferenceCache(db, collection_name, id_field, name_field, mode=cache_mode)
+
+    def all(self):
+        return self.cache.all()
+
+    def by_id(self, doc_id):
+        return self.cache.by_id(doc_id)
+
+    def by_name(self, name):
+        return self.cache.by_name(name)
+
+    def delete_by_id(self, doc_id):
+        """
+        Removes the document and all products that reference it.
+
+        Returns:
+            Number of removed products, or None if the document does not exist.
+        """
+        if self.collection.find_one({self.id_field: doc_id}, {"_id": 1}) is None:
+            return None
+        on_deleted = self.products.removed_by_cascade if self.products else None
+        removed = cascade_delete(self.db, self.collection_name, doc_id, on_deleted=on_deleted)
+        self._changed(deleted_ids=[doc_id])
+        return removed
+
+    def delete_many_by_id(self, ids):
+        return sum(1 for doc_id in ids if self.delete_by_id(doc_id) is not None)
+
+    def _invalidate(self, version):
+        self.cache.invalidate(version)
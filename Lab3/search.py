@@ -0,0 +1,221 @@
+import bisect
+import heapq
+import re
+import threading
+from collections import defaultdict
+
+from pymongo.errors import OperationFailure
+
+# Product search over name and description
+# 'text'   - MongoDB text index (declared in indexes.py), ranked by textScore
+# 'memory' - in-process inverted index with trigrams for partial words, built once
+#            and kept up to date through the product repository listeners
+# 'auto'   - 'text', falling back to 'memory' if the server can't run the query
+
+WORD_RE = re.compile(r'\w+')
+
+# Matches in the name count more than matches in the description
+FIELD_WEIGHTS = {'name': 10, 'description': 1}
+
+RESULT_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "price": 1, "description": 1}
+INDEX_PROJECTION = {"_id": 0, "product_id": 1, "name": 1, "description": 1}
+
+# Postings read per term in the first round of a 'memory' search: this many per requested
+# result, at least MIN_CANDIDATES; every further round reads twice as many
+CANDIDATES_PER_RESULT = 5
+MIN_CANDIDATES = 100
+
+
+def tokenize(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InvertedIndex:
+    """
+    word -> {product_id: weight} postings, plus trigram -> words for partial matches.
+
+    Every word also keeps its postings impact-ordered (weight -> sorted product ids), so a
+    query can stop reading postings once the best results are certain.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.postings = defaultdict(dict)
+        self.impacts = defaultdict(dict)  # word -> weight -> sorted product ids
+        self.grams = defaultdict(set)
+        self.doc_words = {}  # product_id -> words, to remove a document again
+
+    def add(self, doc):
+        doc_id = doc['product_id']
+        weights = defaultdict(int)
+        for field, weight in FIELD_WEIGHTS.items():
+            for word in tokenize(doc.get(field)):
+                weights[word] += weight
+
+        with self._lock:
+            self._remove(doc_id)
+            for word, weight in weights.items():
+                if word not in self.postings:
+                    for gram in trigrams(word):
+                        self.grams[gram].add(word)
+                self.postings[word][doc_id] = weight
+                bisect.insort(self.impacts[word].setdefault(weight, []), doc_id)
+            self.doc_words[doc_id] = list(weights)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for word in self.doc_words.pop(doc_id, ()):
+            postings = self.postings[word]
+            weight = postings.pop(doc_id)
+            impacts = self.impacts[word]
+            ids = impacts[weight]
+            del ids[bisect.bisect_left(ids, doc_id)]
+            if not ids:
+                del impacts[weight]
+            if not postings:
+                del self.postings[word]
+                del self.impacts[word]
+                for gram in trigrams(word):
+                    self.grams[gram].discard(word)
+
+    def _expand(self, term):
+        # Indexed words similar to the term: exact match 1.0, otherwise the trigram overlap
+        if term in self.postings:
+            yield term, 1.0
+        term_grams = trigrams(term)
+        candidates = defaultdict(int)
+        for gram in term_grams:
+            for word in self.grams.get(gram, ()):
+                candidates[word] += 1
+        for word, shared in candidates.items():
+            if word == term:
+                continue
+            similarity = shared / len(term_grams)
+            # Prefixes ("sams" -> "samsung") share all of their trigrams except the last one
+            if similarity >= 0.6:
+                yield word, similarity * 0.8
+
+    def _impact_order(self, word, similarity):
+        # (-impact, product_id) of a word's postings, best first
+        impacts = self.impacts[word]
+        for weight in sorted(impacts, reverse=True):
+            impact = -weight * similarity
+            for doc_id in impacts[weight]:
+                yield impact, doc_id
+
+    def _score(self, doc_id, terms):
+        # Every term counts with its best matching word
+        return sum(max((self.postings[word].get(doc_id, 0) * similarity for word, similarity in words), default=0)
+                   for words in terms)
+
+    def search(self, text, page=0, page_size=20):
+        """
+        Returns one page of (product_id, score) pairs, best first.
+
+        The postings of every term are read best first, in rounds, until no product that
+        hasn't been read can rank among the requested results (threshold algorithm).
+        Candidates are scored exactly, so the cost follows the page size and how well the
+        terms agree, not how common they are.
+        """
+        wanted = (page + 1) * page_size
+        step = max(MIN_CANDIDATES, CANDIDATES_PER_RESULT * wanted)
+        with self._lock:
+            terms = [list(self._expand(term)) for term in set(tokenize(text))]
+            # Per term: postings of all its words merged best first; a product's first entry is its best
+            streams = [heapq.merge(*(self._impact_order(word, similarity) for word, similarity in words))
+                       for words in terms]
+            heads = [next(stream, None) for stream in streams]
+            scores = {}
+            ranked = []
+            while any(heads):
+                for i, stream in enumerate(streams):
+                    read = 0
+                    while heads[i] is not None and read < step:
+                        doc_id = heads[i][1]
+                        if doc_id not in scores:
+                            scores[doc_id] = self._score(doc_id, terms)
+                        heads[i] = next(stream, None)
+                        read += 1
+                step *= 2
+
+                ranked = heapq.nsmallest(wanted, scores.items(), key=lambda item: (-item[1], item[0]))
+                if len(ranked) < wanted:
+                    continue
+                # A product not read yet scores at most the sum of the next impacts, and if it
+                # reaches that sum it comes after the next product id of every term
+                bound = sum(-head[0] for head in heads if head is not None)
+                last_id, last_score = ranked[-1]
+                if last_score > bound or \
+                        (last_score == bound and last_id < max(head[1] for head in heads if head is not None)):
+                    break
+
+        return ranked[page * page_size:]
+
+
+class ProductSearch:
+    def __init__(self, product_repository, mode='auto'):
+        if mode not in ('auto', 'text', 'memory'):
+            raise ValueError(f"Unknown search mode: {mode}")
+        self.repository = product_repository
+        self.mode = mode
+        self._index = None
+        self._index_lock = threading.Lock()
+        product_repository.listeners.append(self._on_change)
+
+    def _memory_index(self):
+        # Built on first use from one projected scan, then maintained incrementally
+        with self._index_lock:
+            if self._index is None:
+                index = InvertedIndex()
+                for doc in self.repository.find_page({}, INDEX_PROJECTION, limit=0, batch_size=1000):
+                    index.add(doc)
+                self._index = index
+        return self._index
+
+    def _on_change(self, repository, created, updated_ids, deleted_ids):
+        index = self._index
+        if index is None:
+            return
+        for doc in created:
+            index.add(doc)
+        if updated_ids:
+            for doc in repository.find_by_ids(updated_ids, INDEX_PROJECTION):
+                index.add(doc)
+        for doc_id in deleted_ids:
+            index.remove(doc_id)
+
+    def _search_text(self, text, page, page_size):
+        cursor = self.repository.read_collection.find(
+            {"$text": {"$search": text}},
+            {**RESULT_PROJECTION, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).skip(page * page_size).limit(page_size)
+        return list(cursor)
+
+    def _search_memory(self, text, page, page_size):
+        ranked = self._memory_index().search(text, page, page_size)
+        if not ranked:
+            return []
+        docs = {doc['product_id']: doc for doc in self.repository.find_by_ids([doc_id for doc_id, _ in ranked], RESULT_PROJECTION)}
+        return [{**docs[doc_id], "score": score} for doc_id, score in ranked if doc_id in docs]
+
+    def search(self, text, page=0, page_size=20):
+        """
+        Returns one page of matching products, best first, each with a "score" field.
+        """
+        if self.mode == 'memory':
+            return self._search_memory(text, page, page_size)
+        try:
+            return self._search_text(text, page, page_size)
+        except OperationFailure:
+            if self.mode == 'text':
+                raise
+            self.mode = 'memory'
+            return self._search_memory(text, page, page_size)
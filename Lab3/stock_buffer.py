@@ -0,0 +1,124 @@
+import threading
+from collections import defaultdict
+
+# Write-coalescing buffer for stock movements
+# Order traffic calls adjust() many times per second; adjustments of the same product are
+# summed in memory and written every FLUSH_INTERVAL seconds (or once MAX_PENDING products
+# are waiting) with ProductRepository.adjust_stock_many(), i.e. one guarded $inc per product
+# per flush in unordered bulk writes. The non-negative guard applies to the net change of a
+# product within one flush. A flush that fails (e.g. a network error) puts its changes back
+# for the next one, unless on_failed takes them.
+# Usage:
+#   with StockBuffer(product_repository, on_rejected=print) as stock:
+#       stock.adjust(101, -1)
+
+FLUSH_INTERVAL = 0.2
+MAX_PENDING = 5000
+
+
+class StockBuffer:
+    def __init__(self, product_repository, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING, on_rejected=None,
+                 on_failed=None):
+        """
+        Args:
+            product_repository: The ProductRepository the changes are written with.
+            flush_interval: Seconds between background flushes.
+            max_pending: Number of waiting products that triggers a flush right away.
+            on_rejected: Callable (product_id, delta) -> None for changes that were not applied
+                (missing product or not enough stock).
+            on_failed: Callable (deltas, error) -> None for a flush that raised; deltas is a dict
+                product_id -> delta that may not have been written. Without it the deltas are
+                put back and retried with the next flush.
+        """
+        self.repository = product_repository
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.on_rejected = on_rejected
+        self.on_failed = on_failed
+
+        self.adjustments = 0
+        self.flushes = 0
+        self.rejected = 0
+        self.failures = 0
+
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def adjust(self, product_id, delta):
+        """
+        Queues a change of the quantity of a product (negative for sold units).
+        """
+        with self._lock:
+            if self._closed.is_set():
+                raise RuntimeError("StockBuffer is closed")
+            self._pending[product_id] += delta
+            self.adjustments += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes all waiting changes now.
+
+        Returns:
+            A dict product_id -> delta of the changes that were rejected.
+        """
+        # One flush at a time so the rejected-write check sees only its own changes
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, defaultdict(int)
+            if not pending:
+                return {}
+            try:
+                rejected = self.repository.adjust_stock_many(pending)
+            except Exception as e:
+                self.failures += 1
+                if self.on_failed:
+                    self.on_failed(dict(pending), e)
+                else:
+                    self._requeue(pending)
+                raise
+            self.flushes += 1
+            self.rejected += len(rejected)
+        if self.on_rejected:
+            for product_id, delta in rejected.items():
+                self.on_rejected(product_id, delta)
+        return rejected
+
+    def _requeue(self, pending):
+        # A write that reached the server before the error may be applied again
+        # (inventory_stats.py reconcile shows such drift); losing order traffic is worse
+        with self._lock:
+            for product_id, delta in pending.items():
+                self._pending[product_id] += delta
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # Keep the thread alive; the changes were put back (or given to on_failed)
+                print(f"Stock flush failed: {e}")
+
+    def close(self):
+        """
+        Stops the background flushes and writes what is still waiting.
+        """
+        self._closed.set()
+        self._wakeup.set()
+        self._thread.join()
+        return self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
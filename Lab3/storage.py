@@ -0,0 +1,149 @@
+import os
+
+import connection
+from bulk_import import DEFAULT_FILES
+from cascade import resume_cascades
+from indexes import ensure_indexes, verify_query_plans
+from inventory_stats import InventoryStats
+from memory_engine import (Engine, MemoryInventoryStats, MemoryProductRepository, MemoryReferenceRepository,
+                           load_json_files)
+from repository import ProductRepository, ReferenceRepository
+
+# Storage backends for the app
+# A backend provides the repositories the menus work with:
+#   products         - ProductRepository interface (see repository.py)
+#   brands           - ReferenceRepository interface, brand_id / brand_name
+#   categories       - ReferenceRepository interface, category_id / category_name
+#   inventory_stats  - .by(dimension) and .reconcile() (see inventory_stats.py)
+# Backends:
+#   'mongodb' - the tv_store database (see connection.py)
+#   'memory'  - in-process engine with an optional append-only log (see memory_engine.py),
+#               works offline and without a mongod
+# Selected by STORAGE_BACKEND; STORAGE_PATH is the data directory of the 'memory' backend
+# (empty - nothing is persisted). A new memory store starts with the shipped JSON files.
+
+SETTINGS = {
+    'backend': os.environ.get('STORAGE_BACKEND', 'mongodb'),
+    'path': os.environ.get('STORAGE_PATH', 'tv_store_data'),
+}
+
+# Brand and category lists are cached. Use 'version' or 'change_stream' mode when several
+# instances of the app work with the same database (see ref_cache.py).
+REF_CACHE_MODE = 'local'
+
+
+class StorageBackend:
+    """
+    Interface of a storage backend.
+    """
+
+    name = None
+    # Whether ProductSearch can use a server-side text index
+    text_search = False
+
+    def __init__(self):
+        self.products = None
+        self.brands = None
+        self.categories = None
+        self.inventory_stats = None
+
+    @property
+    def client(self):
+        """
+        The MongoClient, if the backend has one (used for explains in profiles).
+        """
+        return None
+
+    def startup(self):
+        """
+        Prepares the storage before the menus are shown.
+        """
+
+    def close(self):
+        pass
+
+
+class MongoBackend(StorageBackend):
+    name = 'mongodb'
+    text_search = True
+
+    def __init__(self, listeners=()):
+        super().__init__()
+        # The connection is opened on first use; URI, pool and timeouts come from MONGO_* variables
+        for listener in listeners:
+            connection.add_listener(listener)
+        self.db = connection.LazyDatabase()
+
+        # Listings and search read with MONGO_READ_PREFERENCE (secondaryPreferred by default),
+        # batch writes use MONGO_BULK_WRITE_CONCERN
+        options = {
+            "read_preference": connection.read_preference(),
+            "bulk_write_concern": connection.bulk_write_concern(),
+        }
+        # Product writes keep the per-brand/per-category inventory statistics up to date
+        self.inventory_stats = InventoryStats(self.db)
+        self.products = ProductRepository(self.db, stats=self.inventory_stats, **options)
+        self.brands = ReferenceRepository(self.db, 'brands', 'brand_id', 'brand_name', cache_mode=REF_CACHE_MODE,
+                                          products=self.products, **options)
+        self.categories = ReferenceRepository(self.db, 'category', 'category_id', 'category_name',
+                                              cache_mode=REF_CACHE_MODE, products=self.products, **options)
+
+    @property
+    def client(self):
+        return connection.get_client()
+
+    def startup(self):
+        # Make sure every menu query is served by an index
+        created = ensure_indexes(self.db)
+        if created:
+            print(f"Created indexes: {', '.join(created)}")
+        verify_query_plans(self.db)
+
+        # Finish brand/category removals that were interrupted
+        if resume_cascades(self.db, on_deleted=self.products.removed_by_cascade):
+            self.brands.cache.invalidate()
+            self.categories.cache.invalidate()
+
+
+class MemoryBackend(StorageBackend):
+    name = 'memory'
+
+    def __init__(self, path=None, seed_files=None):
+        """
+        Args:
+            path: Data directory, None to keep nothing.
+            seed_files: (table, path) pairs loaded into a new store, the shipped JSON files by default.
+        """
+        super().__init__()
+        self.engine = Engine(path)
+        if seed_files is None:
+            here = os.path.dirname(os.path.abspath(__file__))
+            seed_files = [(name, os.path.join(here, file_name)) for name, file_name in DEFAULT_FILES]
+        # Only a new store is seeded; one whose records were all removed stays empty
+        if self.engine.created:
+            load_json_files(self.engine, seed_files)
+
+        self.inventory_stats = MemoryInventoryStats(self.engine['products'])
+        self.products = MemoryProductRepository(self.engine, stats=self.inventory_stats)
+        self.brands = MemoryReferenceRepository(self.engine, 'brands', 'brand_id', 'brand_name', products=self.products)
+        self.categories = MemoryReferenceRepository(self.engine, 'category', 'category_id', 'category_name',
+                                                    products=self.products)
+
+    def close(self):
+        self.engine.close()
+
+
+def open_backend(name=None, listeners=()):
+    """
+    Creates the configured backend (STORAGE_BACKEND unless name is given).
+
+    Args:
+        name: 'mongodb' or 'memory'.
+        listeners: pymongo event listeners (e.g. the CommandProfiler) for the 'mongodb' backend.
+    """
+    name = name or SETTINGS['backend']
+    if name == 'mongodb':
+        return MongoBackend(listeners)
+    if name == 'memory':
+        return MemoryBackend(SETTINGS['path'] or None)
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,48 @@
+import unittest
+
+from extract import BACKENDS, extract_products
+
+# All HTML extraction backends must return the same rows
+# Usage:
+#   python -m unittest test_extract
+
+LISTING = b"""
+<html><body>
+<div class="grid">
+  <div class="x gridview-item w-100">
+    <a class="product-title-link line-clamp" href="/ip/1">Samsung 55" <b>Neo</b> QLED
+      4K   Smart TV</a>
+    <div><span class="price now">Now <span>$1,299.99</span></span></div>
+  </div>
+  <div class="gridview-item">
+    <a class="product-title-link" href="/ip/2">onn. 50&#8221; Class 4K LED</a>
+    <span class="price">$198.00</span>
+  </div>
+  <div class="gridview-item">
+    <a class="product-title-link" href="/ip/3">No price here</a>
+  </div>
+  <div class="not-a-gridview-item">
+    <a class="product-title-link" href="/ip/4">Ignored</a>
+    <span class="price">$1.00</span>
+  </div>
+</div>
+</body></html>
+"""
+
+EXPECTED = [
+    ('Samsung 55" Neo QLED 4K Smart TV', 'Now $1,299.99', 1299.99),
+    ('onn. 50” Class 4K LED', '$198.00', 198.0),
+]
+
+
+class ExtractBackendsTest(unittest.TestCase):
+    def test_every_backend_returns_the_same_rows(self):
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                rows = [(row['title'], row['price'], row['price_value'])
+                        for row in extract_products(LISTING, backend)]
+                self.assertEqual(rows, EXPECTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from memory_engine import LOG_FILE, SNAPSHOT_FILE, Engine
+from storage import MemoryBackend
+
+# Persistence, crash recovery and seeding of the in-process storage engine
+# Usage:
+#   python -m unittest test_memory_engine
+
+
+def product(product_id, price=100.0):
+    return {"product_id": product_id, "name": f"TV {product_id}", "price": price, "quantity": 1,
+            "brand_id": 0, "category_id": 0}
+
+
+class EnginePersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.path, LOG_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def crash(self, engine):
+        # Leaves the engine without close(), so nothing is compacted
+        engine._log_file.close()
+        engine._log_file = None
+
+    def test_log_is_replayed_after_crash(self):
+        engine = Engine(self.path)
+        engine['products'].insert(product(100))
+        engine['products'].insert(product(101))
+        engine['products'].update(100, {"price": 90.0})
+        engine['products'].delete(101)
+        self.crash(engine)
+
+        engine = Engine(self.path)
+        self.assertEqual(engine['products'].get(100)["price"], 90.0)
+        self.assertIsNone(engine['products'].get(101))
+        engine.close()
+
+    def test_close_compacts_into_snapshot(self):
+        engine = Engine(self.path)
+        engine['products'].insert(product(100))
+        engine.close()
+
+        self.assertTrue(os.path.exists(os.path.join(self.path, SNAPSHOT_FILE)))
+        self.assertEqual(os.path.getsize(self.log_path), 0)
+        engine = Engine(self.path)
+        self.assertEqual(engine['products'].get(100)["name"], "TV 100")
+        engine.close()
+
+    def test_torn_write_is_cut_off(self):
+        engine = Engine(self.path)
+        engine['products'].insert(product(100))
+        self.crash(engine)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write('{"op": "put", "table": "products", "doc": {"product_id": 1')
+
+        # The torn entry is dropped and new entries start on a line of their own
+        engine = Engine(self.path)
+        self.assertIsNone(engine['products'].get(1))
+        engine['products'].insert(product(102))
+        self.crash(engine)
+
+        engine = Engine(self.path)
+        self.assertEqual(sorted(doc["product_id"] for doc in engine['products'].find()), [100, 102])
+        engine.close()
+
+
+class MemoryBackendSeedTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.seed_path = os.path.join(self.path, 'brands.json')
+        with open(self.seed_path, 'w', encoding='utf-8') as f:
+            json.dump([{"brand_id": 0, "brand_name": "Apple"}], f)
+        self.data_path = os.path.join(self.path, 'data')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def open_backend(self):
+        return MemoryBackend(self.data_path, seed_files=[('brands', self.seed_path)])
+
+    def test_only_a_new_store_is_seeded(self):
+        backend = self.open_backend()
+        self.assertEqual([brand["brand_name"] for brand in backend.brands.all()], ["Apple"])
+        backend.brands.delete_by_id(0)
+        backend.close()
+
+        backend = self.open_backend()
+        self.assertEqual(list(backend.brands.all()), [])
+        backend.close()
+
+
+if __name__ == '__main__':
+    unittest.main()